@@ -123,6 +123,8 @@ class AssimuloCVode():
         self.atol = 1e-6  # Default 1e-6. The absulute tolerance
         self.rtol = 1e-6  # Default 1e-6. The relative tolerance
         self.verbosity = 50  # QUIET = 50 WHISPER = 40 NORMAL = 30 LOUD = 20 SCREAM = 10
+        self.jac = None  # Default None: difference quotients. Function jac(t, x, sw) returning the Jacobian d(rhs)/dx
+        self.completed_step = None  # Default None. Function completed_step(solver) called after each step; returns True for a step event
 
         self.t0 = 0
         self.y0 = None
@@ -157,8 +159,14 @@ class AssimuloCVode():
         problem.handle_event = self.handle_event
         problem.time_events = self.time_events
         problem.finalize = self.finalize
+        if self.jac is not None:
+            problem.jac = self.jac
+        if self.completed_step is not None:
+            problem.step_events = self.completed_step
 
         simulation = CVode(problem)
+        if self.jac is not None:
+            simulation.usejac = True
 
         # Change multistep method: 'adams' or 'VDF'
         if self.discr == 'Adams':
@@ -215,6 +223,8 @@ class AssimuloIda():
         self.tout1 = 0.001  # Default 0.001. The value used in the internal Sundials function for determine init. cond.
         # self.suppress_alg = False   #Default False. Indicates that the error-tests are suppressed on algebraic variables
         self.lsoff = False  # Default False. Value to turn OFF Sundials LineSearch when calculating initial conditions.
+        self.jac = None  # Default None: difference quotients. Function jac(c, t, x, xd, sw) returning d(res)/dx + c*d(res)/dxd
+        self.completed_step = None  # Default None. Function completed_step(solver) called after each step; returns True for a step event
 
         self.t0 = 0
         self.y0 = None
@@ -250,8 +260,14 @@ class AssimuloIda():
         problem.handle_event = self.handle_event
         problem.time_events = self.time_events
         problem.finalize = self.finalize
+        if self.jac is not None:
+            problem.jac = self.jac
+        if self.completed_step is not None:
+            problem.step_events = self.completed_step
         # Create IDA object and set additional parameters
         simulation = IDA(problem)
+        if self.jac is not None:
+            simulation.usejac = True
         simulation.atol = self.atol
         simulation.rtol = self.rtol
         simulation.verbosity = self.verbosity
@@ -23,6 +23,8 @@ You should have received a copy of the GNU Lesser General Public License
 along with PySimulator. If not, see www.gnu.org/licenses.
 '''
 
+import os
+
 from PySide import QtGui, QtCore
 
 
@@ -32,10 +34,66 @@ def NewConnectME(model, gui):
     
     
     
+class ConnectedFMUsThread(QtCore.QThread):
+    ''' Thread for the simulation of FMUs for CoSimulation connected by the connection description fileName '''
+    # Name of the result file of a finished simulation
+    resultFileReady = QtCore.Signal(unicode)
+
+    def __init__(self, parent, fileName):
+        super(ConnectedFMUsThread, self).__init__(parent)
+        self.fileName = fileName
+        self.master = None
+        self.stopRequest = False
+        self.running = False
+
+    def run(self):
+        from ...Simulator.FMUSimulator import ConnectedFMUs
+
+        self.running = True
+        try:
+            self.master = ConnectedFMUs.ConnectedFMUs(self.fileName)
+            self.master.stopRequest = self.stopRequest
+            try:
+                resultFileName = self.master.simulate()
+            finally:
+                self.master.close()
+            self.resultFileReady.emit(unicode(resultFileName).replace('\\', '/'))
+        except Exception as e:
+            if hasattr(e, 'msg'):
+                print e.msg
+            else:
+                print e
+        finally:
+            self.running = False
+
+    def stop(self):
+        self.stopRequest = True
+        if self.master is not None:
+            self.master.stopRequest = True
+
+
 def NewConnectCS(model, gui):
-    print "New connected FMU for CoSimulation"
-    pass     
-    
+    ''' Simulates FMUs for CoSimulation connected by a connection description
+        (see Simulator/FMUSimulator/ConnectedFMUs.py) in a thread and opens the result file
+    '''
+    if hasattr(gui, '_connectedFMUsThread') and gui._connectedFMUsThread.running:
+        print "A simulation of connected FMUs is still running."
+        return
+
+    (fileName, trash) = QtGui.QFileDialog().getOpenFileName(gui, 'Open Connection Description', os.getcwd(), '(*.ini);;All Files(*.*)')
+    if fileName == '':
+        return
+    gui._connectedFMUsThread = ConnectedFMUsThread(None, fileName)
+    gui._connectedFMUsThread.resultFileReady.connect(gui.openResultFile)
+    gui._connectedFMUsThread.start()
+
+
+def StopConnectCS(model, gui):
+    ''' Stops the running simulation of connected FMUs for CoSimulation '''
+    if hasattr(gui, '_connectedFMUsThread') and gui._connectedFMUsThread.running:
+        gui._connectedFMUsThread.stop()
+        print "Try to cancel simulation of connected FMUs ..."
+
 
 def Settings(model, gui):    
 
@@ -98,4 +156,4 @@ def getModelCallbacks():
         return a list of lists, one list for each callback, each sublist
         containing a name for the function and a function pointer
     '''
-    return [["New connected FMU for Model Exchange...", NewConnectME], ["New connected FMU for CoSimulation...", NewConnectCS], ["Settings...", Settings]]
\ No newline at end of file
+    return [["New connected FMU for Model Exchange...", NewConnectME], ["New connected FMU for CoSimulation...", NewConnectCS], ["Stop connected FMU for CoSimulation", StopConnectCS], ["Settings...", Settings]]
\ No newline at end of file
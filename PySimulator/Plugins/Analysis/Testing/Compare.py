@@ -26,8 +26,53 @@ along with PySimulator. If not, see www.gnu.org/licenses.
 import numpy
 
 
-def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
+# Maximum number of matrix elements (intervals * signals) processed at once
+# by the vectorized integration in _integralsVectorized
+vectorizedBlockSize = 2 ** 20
+
+# Estimated number of float64 copies of a data block that are alive at the same time
+# in CompareStreaming (read data, extrapolation, integration)
+streamingMemoryFactor = 16
+# Minimum number of rows of a time window in CompareStreaming
+streamingMinimumRows = 1000
+
+
+def prepareMatrix(t, y):
+    '''
+    Converts the time vector t and the matrix y of a constant interpolated
+    time series into a time series with linear interpolation by doubling
+    each point (staircase).
+    Note that integrals can handle constant interpolated series directly,
+    without building these matrices.
+    '''
+    if t is None or y is None:
+        print "Not supported to prepare None-vector/matrix."
+        return None, None
+
+    if len(t) <> y.shape[0]:
+        print "prepareMatrix: Length of time vector and number of rows of y have to be identical."
+        return None, None
+    # yNew = [y0, y0, y1, y1, ..., yn, yn]; tNew = [t0, t1, t1, t2, t2, ..., tn, tn + 1]
+    yNew = numpy.repeat(y, 2, axis=0).astype(numpy.float64, copy=False)
+    tNew = numpy.empty((t.shape[0] * 2,))
+    tNew[:-1] = numpy.repeat(t, 2)[1:]
+    tNew[-1] = t[-1] + 1
+    return tNew, yNew
+
+
+def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2, loop=False, constantA=False, constantB=False):
+    '''
+    Integral norms of fA - fB, fA and fB from t1 to t2 divided by (t2 - t1),
+    see integrals for the arguments
+    '''
+    NfAB, NfA, NfB, error = integrals(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2, loop, constantA, constantB)
+    return NfAB / (t2 - t1), NfA / (t2 - t1), NfB / (t2 - t1), error
+
+
+def integrals(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2, loop=False, constantA=False, constantB=False):
     '''
+    Integrals of abs(fA - fB), abs(fA) and abs(fB) from t1 to t2
+
     tAIn: numpy vector
     fAIn: numpy array (number of rows is equal to that of tAIn)
     iA:   numpy vector
@@ -37,6 +82,11 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
     iB:   numpy vector
     sB:   numpy vector (length is equal to length of iB)
     t1,t2: start and stop time for the integral norm
+    loop: if True, the integrals are computed by the (slow) reference
+          implementation looping over all time intervals
+    constantA, constantB: if True, fA or fB is interpolated constantly between
+          its time points (and extrapolated constantly). This gives the same results as
+          linear interpolation of prepareMatrix(tAIn, fAIn) or prepareMatrix(tBIn, fBIn)
     '''
 
     error = False
@@ -47,9 +97,6 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
     NfAB = numpy.zeros((nSignals,))
     NfA = numpy.zeros((nSignals,))
     NfB = numpy.zeros((nSignals,))
-    AfA = numpy.zeros((nSignals,))
-    AfB = numpy.zeros((nSignals,))
-    AfAB = numpy.zeros((nSignals,))
 
     if len(iB) <> nSignals:
         print "Number of indexes iA, iB must be equal."
@@ -62,17 +109,18 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
     dt = abs(t1) + abs(t2) + 1
 
     # Add first and last point for possibly necessary extrapolations
-    tA = numpy.hstack((min(tAIn[0] - dt, t1), tAIn, max(tAIn[-1] + dt, t2)))
-    tB = numpy.hstack((min(tBIn[0] - dt, t1), tBIn, max(tBIn[-1] + dt, t2)))
+    # (and the point t[-1] + 1 for constant interpolation as in prepareMatrix)
+    tA = numpy.hstack((min(tAIn[0] - dt, t1), tAIn) + ((tAIn[-1] + 1,) if constantA else ()) + (max(tAIn[-1] + dt, t2),))
+    tB = numpy.hstack((min(tBIn[0] - dt, t1), tBIn) + ((tBIn[-1] + 1,) if constantB else ()) + (max(tBIn[-1] + dt, t2),))
 
 
     # Default values (for constant extrapolation)
-    fA = numpy.vstack((fAIn[0, :], fAIn, fAIn[-1, :]))
-    fB = numpy.vstack((fBIn[0, :], fBIn, fBIn[-1, :]))
+    fA = numpy.vstack((fAIn[0, :], fAIn, fAIn[-1, :]) + ((fAIn[-1, :],) if constantA else ()))
+    fB = numpy.vstack((fBIn[0, :], fBIn, fBIn[-1, :]) + ((fBIn[-1, :],) if constantB else ()))
 
 
     # Linear extrapolation where necessary
-    if t1 < tA[1]:
+    if t1 < tA[1] and not constantA:
         if tA[1] == tA[2]:
             '''
             for i in xrange(nSignals):
@@ -87,7 +135,7 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
             fA[0, iA] = fA[1, iA]
         else:
             fA[0, iA] = fA[1, iA] + (fA[2, iA] - fA[1, iA]) * (tA[0] - tA[1]) / (tA[2] - tA[1])
-    if t1 < tB[1]:
+    if t1 < tB[1] and not constantB:
         if tB[1] == tB[2]:
             '''
             for i in xrange(nSignals):
@@ -102,7 +150,7 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
             fB[0, iB] = fB[1, iB]
         else:
             fB[0, iB] = fB[1, iB] + (fB[2, iB] - fB[1, iB]) * (tB[0] - tB[1]) / (tB[2] - tB[1])
-    if t2 > tA[-2]:
+    if t2 > tA[-2] and not constantA:
         if tA[-2] == tA[-3]:
             '''
             for i in xrange(nSignals):
@@ -117,7 +165,7 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
             fA[-1, iA] = fA[-2, iA]
         else:
             fA[-1, iA] = fA[-3, iA] + (fA[-2, iA] - fA[-3, iA]) * (tA[-1] - tA[-3]) / (tA[-2] - tA[-3])
-    if t2 > tB[-2]:
+    if t2 > tB[-2] and not constantB:
         if tB[-2] == tB[-3]:
             '''
             for i in xrange(nSignals):
@@ -141,6 +189,33 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
     '''
     Now begin computing the integrals
     '''
+    if loop:
+        # The reference implementation needs linear interpolated series
+        if constantA:
+            tA, fA = prepareMatrix(tA, fA)
+        if constantB:
+            tB, fB = prepareMatrix(tB, fB)
+        NfAB, NfA, NfB = _integralsLoop(tA, fA, iA, sA, tB, fB, iB, sB, t1, t2)
+    else:
+        NfAB, NfA, NfB = _integralsVectorized(tA, fA, iA, sA, tB, fB, iB, sB, t1, t2, constantA, constantB)
+
+    return NfAB, NfA, NfB, error
+
+
+
+def _integralsLoop(tA, fA, iA, sA, tB, fB, iB, sB, t1, t2):
+    '''
+    Reference implementation of integrals:
+    Loops over all intervals of the merged time grid of tA and tB.
+    tA, fA, tB, fB must already be extended for extrapolation (see integrals).
+    '''
+    nSignals = len(iA)
+    NfAB = numpy.zeros((nSignals,))
+    NfA = numpy.zeros((nSignals,))
+    NfB = numpy.zeros((nSignals,))
+    AfA = numpy.zeros((nSignals,))
+    AfB = numpy.zeros((nSignals,))
+    AfAB = numpy.zeros((nSignals,))
 
     s2 = t1
     s1 = t1
@@ -215,7 +290,92 @@ def normDiff(tAIn, fAIn, iA, sA, tBIn, fBIn, iB, sB, t1, t2):
         NfA += AfA
         NfB += AfB
 
-    return NfAB / (t2 - t1), NfA / (t2 - t1), NfB / (t2 - t1), error
+    return NfAB, NfA, NfB
+
+
+def _area(F1, F2, ds, tm1, tm2):
+    '''
+    Integral of abs(F) over intervals of length ds, where F is linear in
+    each interval with the values F1, F2 at its borders. If F changes its sign,
+    the integral is split at the zero crossing.
+    tm1, tm2: start and stop times of the intervals (ds = tm2 - tm1)
+    '''
+    r1 = F1 >= 0  # sgn(F1)
+    r2 = F2 >= 0  # sgn(F2)
+    sg = (2 * r1 - 1) * 0.5
+    tm = tm1 - F1 * ds / (F2 - F1)
+    return numpy.where(r1 == r2, sg * (F1 + F2) * ds, sg * (F1 * (tm - tm1) + F2 * (tm - tm2)))
+
+
+def _integralsVectorized(tA, fA, iA, sA, tB, fB, iB, sB, t1, t2, constantA=False, constantB=False):
+    '''
+    Vectorized implementation of integrals:
+    All intervals of the merged time grid of tA and tB are handled at once,
+    the signals are processed in blocks of at most vectorizedBlockSize
+    elements. Gives the same results as _integralsLoop.
+    constantA, constantB: see integrals
+    '''
+    nSignals = len(iA)
+    NfAB = numpy.zeros((nSignals,))
+    NfA = numpy.zeros((nSignals,))
+    NfB = numpy.zeros((nSignals,))
+
+    # Merged time grid of all points in (t1, t2)
+    grid = numpy.unique(numpy.concatenate(([t1], tA[(tA > t1) & (tA < t2)], tB[(tB > t1) & (tB < t2)], [t2])))
+    s1 = grid[:-1]
+    s2 = grid[1:]
+    if len(s1) == 0 or nSignals == 0:
+        return NfAB, NfA, NfB
+
+    # Index of the interval in tA and tB that contains [s1, s2]
+    kf = numpy.searchsorted(tA, s1, side='right') - 1
+    kg = numpy.searchsorted(tB, s1, side='right') - 1
+
+    # Relative positions of s1, s2 within the intervals of tA and tB
+    wA1 = ((s1 - tA[kf]) / (tA[kf + 1] - tA[kf])).astype(numpy.result_type(fA, numpy.float64(0)))
+    wA2 = ((s2 - tA[kf]) / (tA[kf + 1] - tA[kf])).astype(numpy.result_type(fA, numpy.float64(0)))
+    wB1 = ((s1 - tB[kg]) / (tB[kg + 1] - tB[kg])).astype(numpy.result_type(fB, numpy.float64(0)))
+    wB2 = ((s2 - tB[kg]) / (tB[kg + 1] - tB[kg])).astype(numpy.result_type(fB, numpy.float64(0)))
+
+    ds = (s2 - s1)[:, numpy.newaxis]
+    tm1 = s1[:, numpy.newaxis]
+    tm2 = s2[:, numpy.newaxis]
+
+    blockSize = max(1, vectorizedBlockSize // len(s1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for j in xrange(0, nSignals, blockSize):
+            jA = iA[j:j + blockSize]
+            jB = iB[j:j + blockSize]
+
+            fA1 = fA[kf[:, numpy.newaxis], jA]
+            if constantA:
+                FA1 = sA[j:j + blockSize] * fA1
+                FA2 = FA1
+            else:
+                fA2 = fA[kf[:, numpy.newaxis] + 1, jA]
+                FA1 = sA[j:j + blockSize] * (fA1 + (fA2 - fA1) * wA1[:, numpy.newaxis])
+                FA2 = sA[j:j + blockSize] * (fA1 + (fA2 - fA1) * wA2[:, numpy.newaxis])
+                del fA2
+            del fA1
+
+            fB1 = fB[kg[:, numpy.newaxis], jB]
+            if constantB:
+                FB1 = sB[j:j + blockSize] * fB1
+                FB2 = FB1
+            else:
+                fB2 = fB[kg[:, numpy.newaxis] + 1, jB]
+                FB1 = sB[j:j + blockSize] * (fB1 + (fB2 - fB1) * wB1[:, numpy.newaxis])
+                FB2 = sB[j:j + blockSize] * (fB1 + (fB2 - fB1) * wB2[:, numpy.newaxis])
+                del fB2
+            del fB1
+
+            # cumsum adds the intervals strictly one after another as in _integralsLoop
+            # (sum might use pairwise summation, which gives slightly different results)
+            NfA[j:j + blockSize] = _area(FA1, FA2, ds, tm1, tm2).cumsum(axis=0)[-1]
+            NfB[j:j + blockSize] = _area(FB1, FB2, ds, tm1, tm2).cumsum(axis=0)[-1]
+            NfAB[j:j + blockSize] = _area(FA1 - FB1, FA2 - FB2, ds, tm1, tm2).cumsum(axis=0)[-1]
+
+    return NfAB, NfA, NfB
 
 
 def normDiffPar(fA, fB):
@@ -231,7 +391,10 @@ def normDiffPar(fA, fB):
 
 
 
-def Compare(tA, fA, iA, sA, tB, fB, iB, sB, tol=1e-3):
+def Compare(tA, fA, iA, sA, tB, fB, iB, sB, tol=1e-3, constantA=False, constantB=False):
+    '''
+    constantA, constantB: True if fA or fB is interpolated constantly (see integrals)
+    '''
 
     tA2 = tA
     fA2 = fA
@@ -245,19 +408,19 @@ def Compare(tA, fA, iA, sA, tB, fB, iB, sB, tol=1e-3):
             if tA is None:
                 tA2 = [0]
                 tStart = tB[0]
-                tStop = tB[-1]
+                tStop = tB[-1] + 1 if constantB else tB[-1]
             if tB is None:
                 tB2 = [0]
                 tStart = tA[0]
-                tStop = tA[-1]
+                tStop = tA[-1] + 1 if constantA else tA[-1]
         else:
             tStart = min(tA[0], tB[0])
-            tStop = max(tA[-1], tB[-1])
+            tStop = max(tA[-1] + 1 if constantA else tA[-1], tB[-1] + 1 if constantB else tB[-1])
         
         if tStart == tStop:
             diff, NfA, NfB, error = normDiffPar(sA * fA2[0, iA], sB * fB2[0, iB])
         else:
-            diff, NfA, NfB, error = normDiff(tA2, fA2, iA, sA, tB2, fB2, iB, sB, tStart, tStop)
+            diff, NfA, NfB, error = normDiff(tA2, fA2, iA, sA, tB2, fB2, iB, sB, tStart, tStop, False, constantA, constantB)
 
     if error:
         return [False]*len(diff), diff / (1 + NfA + NfB), error
@@ -265,6 +428,108 @@ def Compare(tA, fA, iA, sA, tB, fB, iB, sB, tol=1e-3):
         return diff <= tol * (1 + NfA + NfB), diff / (1 + NfA + NfB), error
 
 
+def _readWindow(t, read, columns, t1, t2):
+    '''
+    Reads the rows of a time series that are needed for the time window [t1, t2],
+    i.e. the rows within the window and the rows just before t1 and after t2.
+    At least two rows are returned, so that a window outside of the time range
+    is extrapolated by the first or last two rows as done by Compare.
+    '''
+    k1 = max(0, min(numpy.searchsorted(t, t1, side='right') - 1, len(t) - 2))
+    k2 = min(len(t), max(numpy.searchsorted(t, t2, side='left') + 1, 2))
+    return t[k1:k2], read(k1, k2, columns)
+
+
+def CompareStreaming(tA, readA, iA, sA, constantA, tB, readB, iB, sB, constantB, tol=1e-3, memoryBudget=256 * 1048576):
+    '''
+    Memory bounded variant of Compare for large result files:
+    The data matrices are not given, but read block-wise by the functions
+    readA(rowStart, rowStop, columns) and readB(rowStart, rowStop, columns).
+    Blocks of columns are compared in time windows, so that the data
+    in memory at the same time does not exceed about memoryBudget bytes.
+    The time vectors tA, tB (None for series of parameters) are still needed completely.
+
+    constantA, constantB: True if the time series is interpolated constantly (see integrals)
+
+    The results are the same as of Compare up to rounding errors.
+    '''
+    nSignals = len(iA)
+    if len(iB) <> nSignals:
+        print "Number of indexes iA, iB must be equal."
+        return [False] * nSignals, numpy.zeros((nSignals,)), True
+
+    diff = numpy.zeros((nSignals,))
+    NfA = numpy.zeros((nSignals,))
+    NfB = numpy.zeros((nSignals,))
+
+    # Size of column blocks and time windows
+    elements = max(1, memoryBudget // (8 * streamingMemoryFactor))
+    nColumns = max(1, min(nSignals, elements // streamingMinimumRows))
+    nRows = max(2, elements // nColumns)
+
+    if tA is None and tB is None:
+        tStart = tStop = 0
+    else:
+        tAStop = None if tA is None else tA[-1] + 1 if constantA else tA[-1]
+        tBStop = None if tB is None else tB[-1] + 1 if constantB else tB[-1]
+        tStart = min([x[0] for x in [tA, tB] if x is not None])
+        tStop = max([x for x in [tAStop, tBStop] if x is not None])
+
+    if tStart == tStop:
+        # Compare the first row only
+        for j in xrange(0, nSignals, nColumns):
+            jA = iA[j:j + nColumns]
+            jB = iB[j:j + nColumns]
+            fA = readA(0, 1, jA)
+            fB = readB(0, 1, jB)
+            diff[j:j + nColumns], NfA[j:j + nColumns], NfB[j:j + nColumns], error = normDiffPar(sA[j:j + nColumns] * fA[0, :], sB[j:j + nColumns] * fB[0, :])
+            if error:
+                break
+    else:
+        # Time windows with at most nRows points of the merged time grid
+        grid = numpy.unique(numpy.concatenate([x for x in [tA, tB] if x is not None]))
+        windows = grid[::nRows]
+        if windows[-1] < tStop:
+            windows = numpy.append(windows, tStop)
+        del grid
+
+        error = False
+        for j in xrange(0, nSignals, nColumns):
+            jA = iA[j:j + nColumns]
+            jB = iB[j:j + nColumns]
+            columns = numpy.arange(len(jA))
+            if tA is None:
+                tAw = [0]
+                fAw = readA(0, 1, jA)
+            if tB is None:
+                tBw = [0]
+                fBw = readB(0, 1, jB)
+            for k in xrange(len(windows) - 1):
+                t1 = windows[k]
+                t2 = windows[k + 1]
+                if tA is not None:
+                    tAw, fAw = _readWindow(tA, readA, jA, t1, t2)
+                if tB is not None:
+                    tBw, fBw = _readWindow(tB, readB, jB, t1, t2)
+                IfAB, IfA, IfB, error = integrals(tAw, fAw, columns, sA[j:j + nColumns], tBw, fBw, columns, sB[j:j + nColumns], t1, t2, False, constantA, constantB)
+                if error:
+                    break
+                diff[j:j + nColumns] += IfAB
+                NfA[j:j + nColumns] += IfA
+                NfB[j:j + nColumns] += IfB
+            if error:
+                break
+
+        diff /= (tStop - tStart)
+        NfA /= (tStop - tStart)
+        NfB /= (tStop - tStart)
+
+    if error:
+        return [False] * len(diff), diff / (1 + NfA + NfB), error
+    else:
+        return diff <= tol * (1 + NfA + NfB), diff / (1 + NfA + NfB), error
+
+
 if __name__ == "__main__":
 
     t1 = numpy.arange(19)
@@ -279,7 +544,25 @@ if __name__ == "__main__":
     F1 = numpy.hstack((numpy.reshape(f1, (len(f1), 1)), numpy.reshape(f3, (len(f3), 1))))
     F2 = numpy.hstack((numpy.reshape(f2, (len(f2), 1)), numpy.reshape(f4, (len(f4), 1))))
 
-    print Compare(t1, F1, t2, F2, 0, 18.002, 1e-3)
-
-
-
+    i = numpy.arange(2)
+    s = numpy.ones((2,), dtype=int)
+    print Compare(t1, F1, i, s, t2, F2, i, s, 1e-3)
+
+    # The vectorized integrals must give exactly the results of the reference loop
+    print normDiff(t1, F1, i, s, t2, F2, i, s, 0, 18.002, loop=True)[:3]
+    print normDiff(t1, F1, i, s, t2, F2, i, s, 0, 18.002)[:3]
+
+    # CompareStreaming must give the results of Compare also for small memory budgets
+    # and time ranges that do not overlap completely
+    def reader(f):
+        return lambda rowStart, rowStop, columns: f[rowStart:rowStop, columns]
+    for tA, tB in [(numpy.linspace(0, 4, 41), numpy.linspace(0, 8, 81)),
+                   (numpy.linspace(0, 8, 81), numpy.linspace(4, 8, 41)),
+                   (numpy.linspace(0, 3, 31), numpy.linspace(5, 8, 31))]:
+        FA = numpy.column_stack((2 * tA, numpy.sin(tA)))
+        FB = numpy.column_stack((2 * tB, numpy.sin(tB)))
+        result = Compare(tA, FA, i, s, tB, FB, i, s, 1e-3)
+        for memoryBudget in [1, 8 * streamingMemoryFactor * streamingMinimumRows, 256 * 1048576]:
+            streamed = CompareStreaming(tA, reader(FA), i, s, False, tB, reader(FB), i, s, False, 1e-3, memoryBudget)
+            assert list(streamed[0]) == list(result[0]) and numpy.allclose(streamed[1], result[1], rtol=1e-10, atol=1e-12), (memoryBudget, result, streamed)
+        print result[:2]
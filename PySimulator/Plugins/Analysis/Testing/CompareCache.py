@@ -0,0 +1,114 @@
+﻿#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (C) 2011-2015 German Aerospace Center DLR
+(Deutsches Zentrum fuer Luft- und Raumfahrt e.V.),
+Institute of System Dynamics and Control
+All rights reserved.
+
+This file is part of PySimulator.
+
+PySimulator is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PySimulator is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with PySimulator. If not, see www.gnu.org/licenses.
+'''
+
+
+'''
+***************************
+Cache of the results of comparing two result files.
+
+A comparison is identified by the content hashes of both result files and the tolerance.
+For each compared variable the cache stores whether it is identical within the
+tolerance and its estimated tolerance. The content hash of a result file is
+stored together with its size and modification time and only recomputed when these change.
+Each entry is a separate file, so that several processes can use the cache concurrently.
+***************************
+'''
+
+
+import os
+import cPickle
+import hashlib
+
+
+class CompareCache():
+    ''' Comparison cache in the directory cacheDir '''
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self.filesDir = os.path.join(cacheDir, 'files')
+        if not os.path.isdir(self.filesDir):
+            try:
+                os.makedirs(self.filesDir)
+            except OSError:
+                # created by another process in the meantime
+                pass
+
+    def fileHash(self, fileName):
+        ''' Returns the md5 hash of the content of fileName '''
+        s = os.stat(fileName)
+        stamp = (s.st_size, s.st_mtime)
+        entry = os.path.join(self.filesDir, hashlib.md5(os.path.abspath(fileName).encode('utf-8')).hexdigest() + '.pickle')
+        info = self._load(entry)
+        if info is not None and info[0] == stamp:
+            return info[1]
+        h = hashlib.md5()
+        f = open(fileName, 'rb')
+        while True:
+            block = f.read(1048576)
+            if not block:
+                break
+            h.update(block)
+        f.close()
+        self._save(entry, (stamp, h.hexdigest()))
+        return h.hexdigest()
+
+    def key(self, fileName1, fileName2, tol):
+        ''' Returns the key of the comparison of fileName1 and fileName2 with tolerance tol '''
+        return hashlib.md5(self.fileHash(fileName1) + self.fileHash(fileName2) + repr(float(tol))).hexdigest()
+
+    def get(self, key):
+        ''' Returns the dictionary variable name -> (identical, estTol) of a comparison, or None if not cached '''
+        return self._load(os.path.join(self.cacheDir, key + '.pickle'))
+
+    def put(self, key, results):
+        ''' Stores the dictionary variable name -> (identical, estTol) of a comparison '''
+        self._save(os.path.join(self.cacheDir, key + '.pickle'), results)
+
+    def _load(self, fileName):
+        if not os.path.isfile(fileName):
+            return None
+        try:
+            f = open(fileName, 'rb')
+            try:
+                return cPickle.load(f)
+            finally:
+                f.close()
+        except:
+            # incomplete or unreadable entry
+            return None
+
+    def _save(self, fileName, value):
+        # Write to a file of this process first, so that readers never see an incomplete entry
+        tmpFileName = fileName + '.' + str(os.getpid()) + '.tmp'
+        f = open(tmpFileName, 'wb')
+        cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        try:
+            if os.path.isfile(fileName):
+                os.remove(fileName)
+            os.rename(tmpFileName, fileName)
+        except OSError:
+            # the entry was written by another process at the same time
+            if os.path.isfile(tmpFileName):
+                os.remove(tmpFileName)
@@ -0,0 +1,155 @@
+﻿#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (C) 2011-2015 German Aerospace Center DLR
+(Deutsches Zentrum fuer Luft- und Raumfahrt e.V.),
+Institute of System Dynamics and Control
+All rights reserved.
+
+This file is part of PySimulator.
+
+PySimulator is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PySimulator is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with PySimulator. If not, see www.gnu.org/licenses.
+'''
+
+
+'''
+***************************
+Cache of reference (baseline) result files for comparing several result directories in parallel.
+
+Each reference result file is loaded once and converted into a directory with
+numpy files (independent variable and data matrix of each time series) and the
+dictionary of variables. The worker processes memory-map these files read-only
+instead of parsing the reference result file again for each compared directory.
+***************************
+'''
+
+
+import os
+import shutil
+import cPickle
+import numpy
+from ...SimulationResult import IntegrationResults
+
+
+def _stamp(fileName):
+    ''' Key of the content of fileName: absolute path, size and modification time '''
+    s = os.stat(fileName)
+    return repr((os.path.abspath(fileName), s.st_size, s.st_mtime))
+
+
+def isNeeded(fileName):
+    ''' Returns False if the plugin of the result file fileName reads its data lazily
+        (e.g. memory-mapped), so that a cache would only cost time and disk space
+    '''
+    from ... import SimulationResult
+
+    suffix = fileName.rsplit('.', 1)[-1]
+    if suffix not in SimulationResult.fileExtension:
+        return False
+    return not SimulationResult.plugin[SimulationResult.fileExtension.index(suffix)].Results.readsDataLazily
+
+
+def build(fileName, cacheDir):
+    ''' Converts the result file fileName into the cache directory cacheDir.
+        Returns True if the cache is available, and False if the result file
+        cannot be cached (e.g. its data is not loaded completely by the plugin).
+        A cache of the unchanged result file (same size and modification time)
+        is reused, any other content of cacheDir is removed.
+    '''
+    from ...Simulator import SimulatorBase
+
+    if isAvailable(cacheDir, fileName):
+        return True
+    if os.path.exists(cacheDir):
+        shutil.rmtree(cacheDir)
+    model = SimulatorBase.Model(None, None, None)
+    model.loadResultFile(fileName)
+    results = model.integrationResults
+    try:
+        variables = results.getVariables()
+        if any(x.data is None for x in results.timeSeries):
+            return False
+        os.makedirs(cacheDir)
+        for i, series in enumerate(results.timeSeries):
+            if series.independentVariable is not None:
+                numpy.save(os.path.join(cacheDir, 't' + str(i) + '.npy'), series.independentVariable)
+            numpy.save(os.path.join(cacheDir, 'data' + str(i) + '.npy'), series.data)
+        info = dict()
+        info['fileName'] = results.fileName
+        info['interpolationMethod'] = [x.interpolationMethod for x in results.timeSeries]
+        info['variables'] = variables
+        f = open(os.path.join(cacheDir, 'variables.pickle'), 'wb')
+        cPickle.dump(info, f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+        # Written last, so that its existence marks a complete cache
+        f = open(os.path.join(cacheDir, 'complete'), 'wb')
+        f.write(_stamp(fileName))
+        f.close()
+    except:
+        if os.path.exists(cacheDir):
+            shutil.rmtree(cacheDir)
+        raise
+    finally:
+        results.close()
+    return True
+
+
+def isAvailable(cacheDir, fileName):
+    ''' Returns True if cacheDir contains a complete cache of the result file fileName
+        in its current version
+    '''
+    marker = os.path.join(cacheDir, 'complete')
+    if not os.path.isfile(marker):
+        return False
+    f = open(marker, 'rb')
+    stamp = f.read()
+    f.close()
+    return stamp == _stamp(fileName)
+
+
+class Results(IntegrationResults.Results):
+    ''' Result object for a result file cached by build; the data matrices
+        are memory-mapped read-only
+    '''
+    def __init__(self, cacheDir):
+        IntegrationResults.Results.__init__(self)
+
+        f = open(os.path.join(cacheDir, 'variables.pickle'), 'rb')
+        info = cPickle.load(f)
+        f.close()
+
+        self.fileName = info['fileName']
+        self._variables = info['variables']
+        for i, method in enumerate(info['interpolationMethod']):
+            tFile = os.path.join(cacheDir, 't' + str(i) + '.npy')
+            t = numpy.load(tFile, mmap_mode='r') if os.path.isfile(tFile) else None
+            data = numpy.load(os.path.join(cacheDir, 'data' + str(i) + '.npy'), mmap_mode='r')
+            self.timeSeries.append(IntegrationResults.TimeSeries(t, data, method))
+        self.nTimeSeries = len(self.timeSeries)
+        self.isAvailable = True
+
+    def readData(self, variableName):
+        if variableName not in self._variables:
+            return None, None, None
+        variable = self._variables[variableName]
+        series = self.timeSeries[variable.seriesIndex]
+        y = variable.sign * series.data[:, variable.column]
+        return series.independentVariable, y, series.interpolationMethod
+
+    def getVariables(self):
+        return self._variables
+
+    def getFileInfos(self):
+        return dict()
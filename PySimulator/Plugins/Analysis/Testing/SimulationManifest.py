@@ -0,0 +1,145 @@
+﻿#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (C) 2011-2015 German Aerospace Center DLR
+(Deutsches Zentrum fuer Luft- und Raumfahrt e.V.),
+Institute of System Dynamics and Control
+All rights reserved.
+
+This file is part of PySimulator.
+
+PySimulator is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PySimulator is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with PySimulator. If not, see www.gnu.org/licenses.
+'''
+
+
+'''
+***************************
+Job manifest of a batch simulation (list of simulations defined by a setup file).
+
+The manifest is a csv file with one row per simulator and setup file entry:
+hash of the inputs (settings of the entry and modification time and size of the model files),
+status ('done' or 'failed'), duration of the simulation in seconds, and the result file
+with its modification time and size. When a batch is resumed, a job is skipped
+if it is done, its inputs are unchanged and its result file was not modified afterwards.
+***************************
+'''
+
+
+import os
+import csv
+import hashlib
+
+
+columns = ['simulator', 'job', 'inputHash', 'status', 'duration', 'resultFile', 'resultTime', 'resultSize']
+
+
+def jobKey(entry):
+    ''' Key of a setup file entry (row of the modelList of the Testing plugin) '''
+    return entry['fileName'] + '|' + entry['modelName'] + '|' + entry['subDirectory']
+
+
+def packagesOfEntries(modelList):
+    ''' Returns for each entry of modelList the list of model files of the entry, i.e. the
+        files of the preceding entries without model name (packages) and its own file;
+        None for entries without model name
+    '''
+    packages = []
+    result = []
+    for i in xrange(len(modelList)):
+        packages.append(modelList['fileName'][i])
+        if modelList['modelName'][i] != '':
+            result.append([x for x in packages if x != ''])
+            packages = []
+        else:
+            result.append(None)
+    return result
+
+
+def inputHash(simulatorName, packageNames, entry):
+    ''' Hash of the inputs of a simulation: the settings of the setup file entry
+        and modification time and size of the model files in packageNames
+    '''
+    h = hashlib.md5()
+    h.update(simulatorName.encode('utf-8'))
+    h.update(jobKey(entry).encode('utf-8'))
+    h.update(repr((float(entry['tStart']), float(entry['tStop']), float(entry['tol']), float(entry['stepSize']), int(entry['nInterval']), bool(entry['includeEvents']))))
+    for fileName in packageNames:
+        h.update(fileName.encode('utf-8'))
+        if os.path.isfile(fileName):
+            s = os.stat(fileName)
+            h.update(repr((s.st_mtime, s.st_size)))
+    return h.hexdigest()
+
+
+class Manifest():
+    ''' Job manifest stored in the csv file fileName; it is written after each update,
+        so that the state of the batch survives a crash
+    '''
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.jobs = dict()
+        if os.path.isfile(fileName):
+            f = open(fileName, 'rb')
+            for row in csv.DictReader(f):
+                row = dict((key, value.decode('utf-8')) for key, value in row.iteritems())
+                self.jobs[(row['simulator'], row['job'])] = row
+            f.close()
+
+    def isDone(self, simulatorName, job, inputHash):
+        ''' Returns True if the job finished successfully with the same inputs
+            and its result file is unchanged since then
+        '''
+        row = self.jobs.get((simulatorName, job))
+        if row is None or row['status'] != 'done' or row['inputHash'] != inputHash:
+            return False
+        if not os.path.isfile(row['resultFile']):
+            return False
+        s = os.stat(row['resultFile'])
+        return repr(s.st_mtime) == row['resultTime'] and str(s.st_size) == row['resultSize']
+
+    def duration(self, simulatorName, job):
+        ''' Returns the duration in seconds of the last run of the job, or None if unknown '''
+        row = self.jobs.get((simulatorName, job))
+        if row is None or row['duration'] == '':
+            return None
+        return float(row['duration'])
+
+    def update(self, simulatorName, job, inputHash, status, duration=None, resultFile=None):
+        ''' Records the outcome of a job and writes the manifest '''
+        row = dict(simulator=simulatorName, job=job, inputHash=inputHash, status=status,
+                   duration='' if duration is None else repr(duration),
+                   resultFile='' if resultFile is None else resultFile, resultTime='', resultSize='')
+        if resultFile is not None and os.path.isfile(resultFile):
+            s = os.stat(resultFile)
+            row['resultTime'] = repr(s.st_mtime)
+            row['resultSize'] = str(s.st_size)
+        self.jobs[(simulatorName, job)] = row
+        self.write()
+
+    def write(self):
+        ''' Writes the manifest to a temporary file first, so that a crash
+            does not leave an incomplete manifest
+        '''
+        tmpFileName = self.fileName + '.tmp'
+        f = open(tmpFileName, 'wb')
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for key in sorted(self.jobs.keys()):
+            row = self.jobs[key]
+            writer.writerow([unicode(row[x]).encode('utf-8') for x in columns])
+        f.close()
+        if os.path.isfile(self.fileName):
+            os.remove(self.fileName)
+        os.rename(tmpFileName, self.fileName)
@@ -26,6 +26,9 @@ along with PySimulator. If not, see www.gnu.org/licenses.
 
 
 import Compare
+import ReferenceCache
+import CompareCache
+import SimulationManifest
 import numpy
 import os
 import time
@@ -37,33 +40,28 @@ import datetime
 from PySide import QtGui, QtCore
 from ... import Simulator 
 from ... import SimulationResult
+from ...SimulationResult import IntegrationResults
 from decimal import Decimal
 from multiprocessing import Pool
-
-def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdout, filewritehtml=None,resultfile=None,htmlfile=None,file1=None):
-    def prepareMatrix(t, y):
-        if t is None or y is None:
-            print "Not supported to prepare None-vector/matrix."
-            return None, None
-
-        if len(t) <> y.shape[0]:
-            print "prepareMatrix: Length of time vector and number of rows of y have to be identical."
-            return None, None
-        yNew = numpy.ndarray((y.shape[0] * 2, y.shape[1]))
-        tNew = numpy.ndarray((t.shape[0] * 2,))
-        yNew[0, :] = y[0, :]
-        tNew[0] = t[0]
-        for i in xrange(y.shape[0] - 1):
-            yNew[2 * i + 1, :] = y[i, :]
-            yNew[2 * i + 2, :] = y[i + 1, :]
-            tNew[2 * i + 1] = t[i + 1]
-            tNew[2 * i + 2] = t[i + 1]
-        yNew[-1, :] = y[-1, :]
-        tNew[-1] = t[-1] + 1
-        return tNew, yNew
-    var1 = model1.integrationResults.getVariables()
+import multiprocessing.util
+
+def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdout, filewritehtml=None,resultfile=None,htmlfile=None,file1=None,memoryBudget=None,compareCache=None):
+    ''' Compares the results of model1 and model2.
+        If memoryBudget (in bytes) is given, the data matrices are not loaded
+        completely, but read block-wise from the result files (see Compare.CompareStreaming);
+        the variables are taken from the name index of the results instead of getVariables.
+        The time vectors of the time series are the only data kept in memory completely.
+        If compareCache (see CompareCache.CompareCache) is given, the verdicts of a previous
+        comparison of the same result files with the same tolerance are reused.
+    '''
+    if memoryBudget is None:
+        var1 = model1.integrationResults.getVariables()
+        var2 = model2.integrationResults.getVariables()
+    else:
+        # getVariables may load data matrices and the values of parameters
+        var1 = variablesOfNameIndex(model1.integrationResults)
+        var2 = variablesOfNameIndex(model2.integrationResults)
     var1Name = var1.keys()
-    var2 = model2.integrationResults.getVariables()
     var2Name = var2.keys()
 
     print "Start of comparing results ..."
@@ -75,6 +73,14 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
     allIdentical = True
     maxEstTol = 0.0
 
+    cached = None
+    if compareCache is not None:
+        cacheKey = compareCache.key(model1.integrationResults.fileName, model2.integrationResults.fileName, tol)
+        cached = compareCache.get(cacheKey)
+        if cached is not None:
+            print "Using the cached comparison of unchanged result files"
+        comparedResults = dict()
+
     allNamesBoth = set(var1Name) & set(var2Name)
     allNamesOnce1 = set(var1Name) - set(var2Name)
     allNamesOnce2 = set(var2Name) - set(var1Name)
@@ -82,7 +88,6 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
     nPos = 0
     nNeg = 0
 
-    pMatrix2 = [None] * model2.integrationResults.nTimeSeries
     timeSeries1Names = []
     timeSeries2Names = []
     
@@ -101,11 +106,13 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
     for i in xrange(model1.integrationResults.nTimeSeries):
         if len(timeSeries1Names[i]) > 0:
             t1 = model1.integrationResults.timeSeries[i].independentVariable
-            f1 = model1.integrationResults.timeSeries[i].data
+            constant1 = model1.integrationResults.timeSeries[i].interpolationMethod == "constant" and t1 is not None
 
             numpy.set_printoptions(threshold='nan')
-            if model1.integrationResults.timeSeries[i].interpolationMethod == "constant" and t1 is not None:
-                t1, f1 = prepareMatrix(t1, f1)
+            if memoryBudget is None:
+                f1 = model1.integrationResults.timeSeries[i].data
+            else:
+                read1 = lambda rowStart, rowStop, columns, i=i: model1.integrationResults.readTimeSeriesData(i, columns, rowStart, rowStop)
             for j in xrange(model2.integrationResults.nTimeSeries):
                 if len(timeSeries2Names[j]) > 0:
                     check1 = set(timeSeries1Names[i])
@@ -128,17 +135,20 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
                             k = k + 1
                                           
                         t2 = model2.integrationResults.timeSeries[j].independentVariable
-                        f2 = model2.integrationResults.timeSeries[j].data
-                        
-                        if model2.integrationResults.timeSeries[j].interpolationMethod == "constant" and t2 is not None:
-                            if pMatrix2[j] is None:
-                                t2, f2 = prepareMatrix(t2, f2)
-                                pMatrix2[j] = (t2, f2)
-                            else:
-                                t2 = pMatrix2[j][0]
-                                f2 = pMatrix2[j][1]
-                        
-                        identical, estTol, error = Compare.Compare(t1, f1, i1, s1, t2, f2, i2, s2, tol)
+                        constant2 = model2.integrationResults.timeSeries[j].interpolationMethod == "constant" and t2 is not None
+
+                        readColumns = memoryBudget is not None
+                        if cached is not None and all(name in cached for name in namesBothSub):
+                            identical = [cached[name][0] for name in namesBothSub]
+                            estTol = numpy.array([cached[name][1] for name in namesBothSub])
+                            error = False
+                            readColumns = True
+                        elif memoryBudget is None:
+                            f2 = model2.integrationResults.timeSeries[j].data
+                            identical, estTol, error = Compare.Compare(t1, f1, i1, s1, t2, f2, i2, s2, tol, constant1, constant2)
+                        else:
+                            read2 = lambda rowStart, rowStop, columns, j=j: model2.integrationResults.readTimeSeriesData(j, columns, rowStart, rowStop)
+                            identical, estTol, error = Compare.CompareStreaming(t1, read1, i1, s1, constant1, t2, read2, i2, s2, constant2, tol, memoryBudget)
                               
                         if error:
                             message = u"Error during comparison of results."
@@ -146,6 +156,9 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
                             return
                     
                         maxEstTol = max(maxEstTol, estTol.max())
+                        if compareCache is not None:
+                            for m in xrange(len(namesBothSub)):
+                                comparedResults[namesBothSub[m]] = (bool(identical[m]), float(estTol[m]))
  
                         allIdentical = allIdentical and all(identical)
                         s = sum(identical)
@@ -180,7 +193,17 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
                                     c2 = var2[z].column
                                     l1.append(c1)
                                     l2.append(c2)
-                                generatehtml(f1,f2,diff,l1,l2,htmlfile,resultfile,dircount)
+                                if not readColumns:
+                                    # Plot constant interpolated series as staircase
+                                    g1 = Compare.prepareMatrix(t1, f1)[1] if constant1 else f1
+                                    g2 = Compare.prepareMatrix(t2, f2)[1] if constant2 else f2
+                                    generatehtml(g1,g2,diff,l1,l2,htmlfile,resultfile,dircount)
+                                else:
+                                    # Read only the first column (time) and the column of the variable
+                                    for z, c1, c2 in zip(diff, l1, l2):
+                                        g1 = model1.integrationResults.readTimeSeriesData(i, [0, c1])
+                                        g2 = model2.integrationResults.readTimeSeriesData(j, [0, c2])
+                                        generatehtml(g1,g2,[z],[1],[1],htmlfile,resultfile,dircount)
                         
                                   
 #    if len(allNamesOnce1) > 0:
@@ -209,6 +232,9 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
     # print message
     fileOutput.write(message + u"\n")
 
+    if compareCache is not None and cached != comparedResults:
+        compareCache.put(cacheKey, comparedResults)
+
     print "... done."
     ''' Function call to generate the overview report'''
     if htmlfile is not None:
@@ -216,6 +242,13 @@ def compareResults(model1, model2, dircount=None, tol=1e-3, fileOutput=sys.stdou
 
     return
 
+def variablesOfNameIndex(results):
+    ''' Returns a dictionary of ResultVariable with the location of the variables only
+        (see IntegrationResults.Results.getNameIndex)
+    '''
+    return dict((name, IntegrationResults.ResultVariable(None, None, None, None, seriesIndex, column, sign))
+                for name, (seriesIndex, column, sign) in results.getNameIndex().iteritems())
+
 def htmloverview(fileouthtml,resultfile,file,file1,diff1,difftol,dircount,model1var,model2var,totalComparedvar,maxEstTol):
     '''This function is used to present the users with the overall comparison report of different models, The report includes, for each model the number of variables 
        differed, and a link is provided to inspect the differed variables, if there are no differed variables then no link is provided '''
@@ -415,6 +448,13 @@ def simulateListMenu(model, gui):
 
             mainGrid.addWidget(self.simulator, 3, 1)
 
+            self.resume = QtGui.QCheckBox("Resume: only run simulations that failed or whose setup, model files or results changed", self)
+            mainGrid.addWidget(self.resume, 4, 1, 1, 2)
+
+            mainGrid.addWidget(QtGui.QLabel("Last finished:"), 5, 0, QtCore.Qt.AlignRight)
+            self.lastFinished = QtGui.QLabel("", self)
+            mainGrid.addWidget(self.lastFinished, 5, 1, 1, 2)
+            self.nFinished = 0
 
             self.stopButton = QtGui.QPushButton("Stop", self)
             mainGrid.addWidget(self.stopButton, 7, 0)
@@ -463,9 +503,10 @@ def simulateListMenu(model, gui):
             for item in self.simulator.selectedItems():
                 simulators.append(gui.simulatorPlugins[item.text()])
             deleteDir = self.deleteDir.isChecked()
+            resume = self.resume.isChecked()
 
             # Run the simulations
-            gui._simThreadTesting = runListSimulation(gui.rootDir, setupFile, resultsDir, simulators, deleteDir)
+            gui._simThreadTesting = runListSimulation(gui.rootDir, setupFile, resultsDir, simulators, deleteDir, resume)
 
         def parallel(self):
             if hasattr(gui, '_simThreadTesting'):
@@ -480,9 +521,17 @@ def simulateListMenu(model, gui):
             for item in self.simulator.selectedItems():
                 simulators.append(gui.simulatorPlugins[item.text()])
             deleteDir = self.deleteDir.isChecked()
+            resume = self.resume.isChecked()
                         
             # Run parallel simulations
-            gui._simThreadTesting = runParallelSimulation(gui.rootDir, setupFile, resultsDir, simulators, deleteDir)
+            self.nFinished = 0
+            self.lastFinished.setText("")
+            gui._simThreadTesting = runParallelSimulation(gui.rootDir, setupFile, resultsDir, simulators, deleteDir, resume, self.jobFinished)
+
+        def jobFinished(self, simulatorName, modelName, wallTime, cpuTime):
+            ''' Shows the times of a finished parallel simulation '''
+            self.nFinished += 1
+            self.lastFinished.setText("%s by %s: wall time %0.2f s, CPU time %0.2f s (%d simulations finished)" % (modelName, simulatorName, wallTime, cpuTime, self.nFinished))
 
 
         def stop(self):
@@ -548,6 +597,16 @@ def compareListMenu(model, gui):
             mainGrid.addWidget(self.resultEdit, 4, 1)
             browseResult = QtGui.QPushButton("Select", self)
             mainGrid.addWidget(browseResult, 4, 2)
+
+            memoryBudget = QtGui.QLabel("Memory budget [MB]:", self)
+            mainGrid.addWidget(memoryBudget, 5, 0, QtCore.Qt.AlignRight)
+            self.memoryBudgetEdit = QtGui.QLineEdit("", self)
+            self.memoryBudgetEdit.setToolTip("Empty: Load complete result files; otherwise compare result files block-wise within the given memory")
+            mainGrid.addWidget(self.memoryBudgetEdit, 5, 1)
+
+            self.useCache = QtGui.QCheckBox("Reuse the results of previous comparisons of unchanged result files", self)
+            self.useCache.setChecked(True)
+            mainGrid.addWidget(self.useCache, 6, 1, 1, 2)
             
             browseDir1 = QtGui.QPushButton("Select", self)
             mainGrid.addWidget(browseDir1, 0, 2)
@@ -605,6 +664,12 @@ def compareListMenu(model, gui):
 
         def _close_(self):
             self.close()
+
+        def _memoryBudget(self):
+            text = self.memoryBudgetEdit.text().strip()
+            if text == '':
+                return None
+            return int(float(text) * 1048576)
         
         def remove(self):
            listItems=self.directory.selectedItems()
@@ -636,7 +701,7 @@ def compareListMenu(model, gui):
 
             # Run the analysis
             if (len(listdirs)!=0):
-                gui._compareThreadTesting = runCompareResultsInDirectories(gui.rootDir, dir1, listdirs, tol, logDir)
+                gui._compareThreadTesting = runCompareResultsInDirectories(gui.rootDir, dir1, listdirs, tol, logDir, self._memoryBudget(), self.useCache.isChecked())
             else:
                 print 'Select List of Directories to compare'
 
@@ -664,7 +729,7 @@ def compareListMenu(model, gui):
                  
             # Run the analysis
             if (len(listdirs)!=0):
-                gui._compareThreadTesting = runParallelCompareResultsInDirectories(gui.rootDir, dir1, listdirs, tol, logDir)
+                gui._compareThreadTesting = runParallelCompareResultsInDirectories(gui.rootDir, dir1, listdirs, tol, logDir, self._memoryBudget(), self.useCache.isChecked())
             else:
                 print 'Select List of Directories to compare'
                 
@@ -695,7 +760,11 @@ def getPlotCallbacks():
 
 
 
-def runListSimulation(PySimulatorPath, setupFile, resultDir, allSimulators, deleteDir=False):
+def runListSimulation(PySimulatorPath, setupFile, resultDir, allSimulators, deleteDir=False, resume=False):
+    ''' Runs the simulations of the setup file by each of allSimulators.
+        If resume is True, the result directories are not deleted and the simulations that are
+        recorded as done in the job manifest of resultDir with unchanged inputs and result files are skipped.
+    '''
     import configobj
     import csv
 
@@ -759,13 +828,17 @@ def runListSimulation(PySimulatorPath, setupFile, resultDir, allSimulators, dele
     sim.allSimulators = allSimulators
     sim.resultDir = resultDir
     sim.deleteDir = deleteDir
+    sim.resume = resume
     sim.stopRequest = False
     sim.running = False
     sim.start()
 
     return sim
 
-def runParallelSimulation(PySimulatorPath, setupFile, resultDir, allSimulators, deleteDir=False):
+def runParallelSimulation(PySimulatorPath, setupFile, resultDir, allSimulators, deleteDir=False, resume=False, jobFinished=None):
+    ''' Runs the simulations of the setup file in parallel processes, see runListSimulation;
+        jobFinished(simulatorName, modelName, wallTime, cpuTime) is called for each finished simulation
+    '''
     import configobj
     import csv
     print "Start running  Parallel simulations ..."
@@ -798,8 +871,11 @@ def runParallelSimulation(PySimulatorPath, setupFile, resultDir, allSimulators,
     sim.allSimulators = allSimulators
     sim.resultDir = resultDir
     sim.deleteDir = deleteDir
+    sim.resume = resume
     sim.stopRequest = False
     sim.running = False
+    if jobFinished is not None:
+        sim.jobFinished.connect(jobFinished)
     sim.start()
 
     return sim
@@ -807,15 +883,25 @@ def runParallelSimulation(PySimulatorPath, setupFile, resultDir, allSimulators,
          
 class simulationParallelThread(QtCore.QThread):
     ''' Class for the simulation thread '''
+    # simulatorName, modelName, wall time [s], CPU time [s] of each finished simulation
+    jobFinished = QtCore.Signal(str, str, float, float)
+
     def __init__(self, parent):
         super(simulationParallelThread, self).__init__(parent)
     
     def run(self):
         self.running = True
+        ## Status and wall times of previous runs, used to skip unchanged simulations and to start the longest simulations first
+        manifest = SimulationManifest.Manifest(self.resultDir + '/simulationManifest.csv')
+        ## One pool of processes for all simulators; the configuration is passed once to each process
+        simulatorNames = [simulator.__name__.rsplit('.', 1)[-1] for simulator in self.allSimulators]
+        pool = Pool(initializer=_initParallelSimulation, initargs=(self.config, simulatorNames))
         for simulator in self.allSimulators:
+            if self.stopRequest:
+                break
             simulatorName = simulator.__name__.rsplit('.', 1)[-1]
             fullSimulatorResultPath = self.resultDir + '/' + simulatorName
-            if os.path.isdir(fullSimulatorResultPath) and self.deleteDir:
+            if os.path.isdir(fullSimulatorResultPath) and self.deleteDir and not self.resume:
                 for file_object in os.listdir(fullSimulatorResultPath):
                     file_object_path = os.path.join(fullSimulatorResultPath, file_object)
                     if os.path.isfile(file_object_path):
@@ -853,21 +939,7 @@ class simulationParallelThread(QtCore.QThread):
             ## Call prepareSimulationList to translate models in Dymola 
             simulator.prepareSimulationList(globalPackageList, globalModelList, self.config)
             
-            
-            '''create a new list of resultpath, config, and simulatorname to be pickled by the multiprocessing pool.map()'''
-            p=[]
-            c=[]
-            n=[]     
-            p.append(fullSimulatorResultPath)
-            c.append(self.config)
-            n.append(simulatorName)
-            
-            resultpath=p*len(self.modelList['modelName'])
-            config=c*len(self.modelList['modelName'])
-            simname=n*len(self.modelList['modelName'])
-            
             '''create a list of directories for each model and run the simulation in their respective directory to avoid conflicts '''
-            dir=os.getcwd()
             dirs=[]
             for z in xrange(len(self.modelList['modelName'])):
                 s=str(self.modelList['modelName'][z])+str(z)
@@ -878,20 +950,92 @@ class simulationParallelThread(QtCore.QThread):
     
             #check the subdirectory for empty strings and replace it with 'N' for passing to pool.map(), as it cannot process empty list of strings to multiprocess module
             subdirlist= ["N" if not x else x for x in self.modelList['subDirectory']]
-            ## Create a Pool of process and run the Simulation in Parallel
-            pool=Pool()
-            #startTime = time.time() 
-            pool.map(ParallelSimulation, zip(self.modelList['fileName'],self.modelList['modelName'],subdirlist,self.modelList['tStart'],self.modelList['tStop'],self.modelList['tol'],self.modelList['stepSize'],self.modelList['nInterval'],self.modelList['includeEvents'],dirs,resultpath,config,simname))
+
+            ## One job per model; the jobs with the longest wall time of the previous run are started first,
+            ## jobs without a recorded time (e.g. new models) are started before all others
+            ## entries without model name only define packages of the following model
+            packages = SimulationManifest.packagesOfEntries(self.modelList)
+            keys = [SimulationManifest.jobKey(self.modelList[i]) for i in xrange(len(self.modelList))]
+            hashes = [None if packages[i] is None else SimulationManifest.inputHash(simulatorName, packages[i], self.modelList[i]) for i in xrange(len(self.modelList))]
+            order = []
+            for i in xrange(len(self.modelList)):
+                if packages[i] is None:
+                    continue
+                if self.resume and manifest.isDone(simulatorName, keys[i], hashes[i]):
+                    print "Skipping %s by %s (unchanged since last run)" % (self.modelList['modelName'][i], simulatorName)
+                else:
+                    order.append(i)
+            durations = [manifest.duration(simulatorName, keys[i]) for i in xrange(len(self.modelList))]
+            order.sort(key=lambda i: -float('inf') if durations[i] is None else -durations[i])
+            jobs = [(self.modelList['fileName'][i], self.modelList['modelName'][i], subdirlist[i], self.modelList['tStart'][i], self.modelList['tStop'][i], self.modelList['tol'][i], self.modelList['stepSize'][i], self.modelList['nInterval'][i], self.modelList['includeEvents'][i], dirs[i], fullSimulatorResultPath, i, simulatorName) for i in order]
+
+            ## imap_unordered hands out one job at a time to the next free process
+            for index, wallTime, cpuTime, resultFileName in pool.imap_unordered(ParallelSimulation, jobs):
+                if self.stopRequest:
+                    pool.terminate()
+                    break
+                if wallTime is None:
+                    manifest.update(simulatorName, keys[index], hashes[index], 'failed', None, resultFileName)
+                    continue
+                modelName = self.modelList['modelName'][index]
+                manifest.update(simulatorName, keys[index], hashes[index], 'done', wallTime, resultFileName)
+                print "Simulation of %s by %s finished: wall time %0.2f s, CPU time %0.2f s" % (modelName, simulatorName, wallTime, cpuTime)
+                self.jobFinished.emit(simulatorName, modelName, wallTime, cpuTime)
+        if self.stopRequest:
+            pool.terminate()
+            print "Parallel simulation stopped"
+        else:
             pool.close()
-            pool.join()
-            #elapsedTime = time.time() - startTime
-            #print elapsedTime         
-        print "Parallel simulation completed"
+            print "Parallel simulation completed"
+        pool.join()
         self.running = False
-            
+
+
+_parallelSimulationConfig = None
+_parallelSimulationPlugins = dict()
+_parallelSimulationModels = dict()
+
+def _initParallelSimulation(config, simulatorNames):
+    ''' Initializer of the processes of the parallel simulation; stores the configuration
+        and imports the simulator plugins once per process instead of for each job
+    '''
+    global _parallelSimulationConfig
+    _parallelSimulationConfig = config
+    for name in simulatorNames:
+        # same as: from ...Simulator.<name> import <name>
+        _parallelSimulationPlugins[name] = __import__('Simulator.' + name + '.' + name, globals(), locals(), [name], 3)
+    # Close the cached models when the process terminates regularly
+    multiprocessing.util.Finalize(None, _closeParallelSimulationModels, exitpriority=10)
+
+
+def _getParallelSimulationModel(simulator, modelName, packageName, config):
+    ''' Returns the model of the simulator plugin for modelName; models already opened
+        by this process are reused, so that loading (e.g. unzipping an FMU) and translation are done only once
+    '''
+    key = (simulator, packageName[0], modelName)
+    if key in _parallelSimulationModels:
+        model = _parallelSimulationModels[key]
+        model.integrationStatistics.reset()
+    else:
+        model = _parallelSimulationPlugins[simulator].getNewModel(modelName, packageName, config)
+        _parallelSimulationModels[key] = model
+    return model
+
+
+def _closeParallelSimulationModels():
+    ''' Closes all models cached by the process '''
+    for model in _parallelSimulationModels.values():
+        try:
+            model.close()
+        except:
+            pass
+    _parallelSimulationModels.clear()
+
   
 def ParallelSimulation(modellists):
-     'unpacks the modelists and run the simuations in parallel using the multiprocessing module'
+     '''unpacks the modelists and run the simuations in parallel using the multiprocessing module;
+        returns the index of the job, the wall and CPU time of the simulation (None if it failed) and the result file name
+     '''
      packname=[]
      packname.append(modellists[0])     
      modelname=modellists[1]
@@ -904,56 +1048,25 @@ def ParallelSimulation(modellists):
      events=modellists[8]
      dirname=modellists[9]
      path=modellists[10]
-     config=modellists[11]
+     index=modellists[11]
      simulator=modellists[12]
+     config=_parallelSimulationConfig
+     wallTime = None
+     cpuTime = None
      filename,fileExtension = os.path.splitext(packname[0])
      os.chdir(dirname)
+     startWall = time.time()
+     startCpu = os.times()
+     checkextension = []
+     resultFileName = None
      try:
-       '''load the Simulator Module like this, depending on the simulator selected by the users as the pool.map() cannot pickle module types '''
-       if(simulator=='OpenModelica'):
-           from ...Simulator.OpenModelica import OpenModelica
-           extension=OpenModelica.modelExtension
-           checkextension = [s for s in extension if (fileExtension).replace('.','') in s]
-           if checkextension:
-              model=OpenModelica.getNewModel(modelname, packname, config)
-           else:
-              print "WARNING: Simulator OpenModelica " + " cannot handle files ", packname[0], " due to unknown file type(s)."
-             
-       if(simulator=='Dymola'):
-           from ...Simulator.Dymola import Dymola
-           extension=Dymola.modelExtension
-           checkextension = [s for s in extension if (fileExtension).replace('.','') in s]
-           if checkextension:
-             model=Dymola.getNewModel(modelname, packname, config)
-           else:
-             print "WARNING: Simulator Dymola " + " cannot handle files ", packname[0], " due to unknown file type(s)."
-             
-       if(simulator=='FMUSimulator'):
-           from ...Simulator.FMUSimulator import FMUSimulator
-           extension=FMUSimulator.modelExtension
-           checkextension = [s for s in extension if (fileExtension).replace('.','') in s]
-           if checkextension:
-              model=FMUSimulator.getNewModel(modelname, packname, config)
-           else:
-             print "WARNING: Simulator FMUSimulator " + " cannot handle files ", packname[0], " due to unknown file type(s)."
-               
-       if(simulator=='SimulationX'):
-           from ...Simulator.SimulationX import SimulationX
-           extension=SimulationX.modelExtension
+       if simulator in _parallelSimulationPlugins:
+           extension=_parallelSimulationPlugins[simulator].modelExtension
            checkextension = [s for s in extension if (fileExtension).replace('.','') in s]
-           if checkextension:
-               model=SimulationX.getNewModel(modelname, packname, config)
-           else:
-             print "WARNING: Simulator SimulationX " + " cannot handle files ", packname[0], " due to unknown file type(s)."
-
-       if(simulator=='Wolfram'):
-           from ...Simulator.Wolfram import Wolfram
-           extension=Wolfram.modelExtension
-           checkextension = [s for s in extension if (fileExtension).replace('.','') in s]
-           if checkextension:
-              model=Wolfram.getNewModel(modelname, packname, config)
-           else:
-             print "WARNING: Simulator Wolfram " + " cannot handle files ", packname[0], " due to unknown file type(s)."
+       if checkextension:
+           model=_getParallelSimulationModel(simulator, modelname, packname, config)
+       else:
+           print "WARNING: Simulator " + simulator + " cannot handle files ", packname[0], " due to unknown file type(s)."
  
        if (subdir == 'N'):
           resultDir = path        
@@ -973,12 +1086,23 @@ def ParallelSimulation(modellists):
          model.integrationSettings.resultFileIncludeEvents = events
          model.integrationSettings.resultFileName = resultFileName     
          print "Simulating %s by %s (result in %s)..." % (modelname,simulator,resultFileName)
-         model.simulate()
-         model.close()
+         try:
+             model.simulate()
+         except:
+             # Do not reuse a model in an undefined state
+             _parallelSimulationModels.pop((simulator, packname[0], modelname), None)
+             model.close()
+             raise
+         # Release the result file; the model stays open for further runs of this process
+         model.integrationResults.close()
+         wallTime = time.time() - startWall
+         stopCpu = os.times()
+         cpuTime = (stopCpu[0] - startCpu[0]) + (stopCpu[1] - startCpu[1]) + (stopCpu[2] - startCpu[2]) + (stopCpu[3] - startCpu[3])
      except Exception as e:
        import traceback
        traceback.print_exc(e,file=sys.stderr)
        print e
+     return index, wallTime, cpuTime, resultFileName
        
 
 
@@ -998,11 +1122,13 @@ class simulationThread(QtCore.QThread):
             # do nothing, since error message only indicates we are not in debug mode
             pass
         
+        ## Status of previous runs, used to skip unchanged simulations
+        manifest = SimulationManifest.Manifest(self.resultDir + '/simulationManifest.csv')
         #startTime=time.time() 
         for simulator in self.allSimulators:
             simulatorName = simulator.__name__.rsplit('.', 1)[-1]
             fullSimulatorResultPath = self.resultDir + '/' + simulatorName
-            if os.path.isdir(fullSimulatorResultPath) and self.deleteDir:
+            if os.path.isdir(fullSimulatorResultPath) and self.deleteDir and not self.resume:
                 for file_object in os.listdir(fullSimulatorResultPath):
                     file_object_path = os.path.join(fullSimulatorResultPath, file_object)
                     if os.path.isfile(file_object_path):
@@ -1036,6 +1162,7 @@ class simulationThread(QtCore.QThread):
 
                     packageName = []
             simulator.prepareSimulationList(globalPackageList, globalModelList, self.config)
+            packages = SimulationManifest.packagesOfEntries(self.modelList)
             haveCOM = False
 
             try:
@@ -1067,6 +1194,15 @@ class simulationThread(QtCore.QThread):
                                 canLoadAllPackages = False
                                 break
                         if canLoadAllPackages:
+                            job = SimulationManifest.jobKey(self.modelList[i])
+                            jobHash = SimulationManifest.inputHash(simulatorName, packages[i], self.modelList[i])
+                            if self.resume and manifest.isDone(simulatorName, job, jobHash):
+                                print "Skipping %s by %s (unchanged since last run)" % (modelName, simulatorName)
+                                packageName = []
+                                continue
+                            status = 'failed'
+                            duration = None
+                            resultFileName = None
                             try:
                                 '''
                                 Do the numerical integration in a try branch
@@ -1093,7 +1229,10 @@ class simulationThread(QtCore.QThread):
                                 model.integrationSettings.resultFileIncludeEvents = self.modelList['includeEvents'][i]
                                 model.integrationSettings.resultFileName = resultFileName
                                 print "Simulating %s by %s (result in %s)..." % (modelName,simulatorName,resultFileName)
+                                startTime = time.time()
                                 model.simulate()
+                                duration = time.time() - startTime
+                                status = 'done'
 
                             except Simulator.SimulatorBase.Stopping:
                                 print("Solver cancelled ... ")
@@ -1102,7 +1241,9 @@ class simulationThread(QtCore.QThread):
                                 traceback.print_exc(e,file=sys.stderr)
                                 print e
                             finally:
+                                # Closing the model completes the result file, so it is recorded afterwards
                                 model.close()
+                                manifest.update(simulatorName, job, jobHash, status, duration, resultFileName)
                         else:
                             print "WARNING: Simulator " + simulatorName + " cannot handle files ", packageName, " due to unknown file type(s)."
 
@@ -1121,7 +1262,7 @@ class simulationThread(QtCore.QThread):
         self.running = False
         
 
-def runCompareResultsInDirectories(PySimulatorPath, dir1, listdirs, tol, logDir):
+def runCompareResultsInDirectories(PySimulatorPath, dir1, listdirs, tol, logDir, memoryBudget=None, useCache=False):
 
     print "Start comparing results ..."
     compare = CompareThread(None)
@@ -1130,13 +1271,16 @@ def runCompareResultsInDirectories(PySimulatorPath, dir1, listdirs, tol, logDir)
     compare.listdirs= listdirs
     compare.tol = tol
     compare.logDir = logDir
+    compare.memoryBudget = memoryBudget
+    ## Verdicts of unchanged comparisons are kept in the report directory for later runs
+    compare.compareCacheDir = os.path.join(logDir, 'comparecache').replace('\\', '/') if useCache else None
     compare.stopRequest = False
     compare.running = False
     compare.start()
     return compare
 
 
-def runParallelCompareResultsInDirectories(PySimulatorPath, dir1, listdirs, tol, logDir):
+def runParallelCompareResultsInDirectories(PySimulatorPath, dir1, listdirs, tol, logDir, memoryBudget=None, useCache=False):
     print "Start Parallel comparison results ..."
     compare = CompareParallelThread(None)
     compare.PySimulatorPath=PySimulatorPath
@@ -1144,6 +1288,9 @@ def runParallelCompareResultsInDirectories(PySimulatorPath, dir1, listdirs, tol,
     compare.listdirs= listdirs
     compare.tol = tol
     compare.logDir = logDir
+    compare.memoryBudget = memoryBudget
+    ## Verdicts of unchanged comparisons are kept in the report directory for later runs
+    compare.compareCacheDir = os.path.join(logDir, 'comparecache').replace('\\', '/') if useCache else None
     compare.stopRequest = False
     compare.running = False
     compare.start()
@@ -1207,9 +1354,43 @@ class CompareParallelThread(QtCore.QThread):
       ## Create a Pool of process and run the Compare Analysis in Parallel
       pool=Pool()
       startTime = time.time() 
-      pool.map(ParallelCompareAnalysis, zip(listdir1,listdirs,resultfiles,dircount,tol))
+      
+      ## Convert the reference result files once into a cache, which is memory-mapped by all processes;
+      ## the cache is kept for the next run, no cache is needed for a single directory
+      ## or result files that are read lazily by their plugin
+      referenceCacheDir=os.path.join(self.logDir,'referencecache').replace('\\','/')
+      if len(listdirs) > 1:
+          referencefiles=[]
+          for fileName in os.listdir(dir1):
+              splits = fileName.rsplit('.', 1)
+              if len(splits) > 1 and splits[1] in SimulationResult.fileExtension and ReferenceCache.isNeeded(fileName):
+                  referencefiles.append((dir1 + '/' + fileName, referenceCacheDir + '/' + fileName))
+          pool.map(BuildReferenceCache, referencefiles)
+      
+      ## One work unit per pair of (model, directory); the largest files are compared first
+      modelName1, fileName1 = resultFilesInDirectory(dir1)
+      units=[]
+      for i in xrange(len(listdirs)):
+          modelName2, fileName2 = resultFilesInDirectory(listdirs[i])
+          for index, name in enumerate(modelName1):
+              file2 = fileName2[modelName2.index(name)] if name in modelName2 else None
+              units.append((listdir1[i],fileName1[index],listdirs[i],file2,resultfiles[i],dircount[i],index,tol[i],self.memoryBudget,referenceCacheDir,self.compareCacheDir))
+      units.sort(key=compareUnitSize, reverse=True)
+      
+      outputs=[dict() for i in xrange(len(listdirs))]
+      for output in pool.imap_unordered(ParallelCompareModel, units):
+          outputs[output[0]][output[1]] = output[2:]
+          if self.stopRequest:
+              pool.terminate()
+              print "... Comparing result files canceled."
+              self.running = False
+              return
       pool.close()
       pool.join()
+      
+      ## Merge the outputs of the work units into the log and html file of each directory
+      for i in xrange(len(listdirs)):
+          ParallelCompareReport(listdir1[i],listdirs[i],resultfiles[i],[outputs[i][index] for index in sorted(outputs[i])])
       elapsedTime = time.time() - startTime
       #print elapsedTime
       print "Parallel Compare Analysis Completed"
@@ -1232,38 +1413,86 @@ class CompareParallelThread(QtCore.QThread):
             
       self.running = False
 
-def ParallelCompareAnalysis(directories):
-    'unpack the directories and start running the compare analysis in parallel'
-    
-    dir1=directories[0]
-    dir2=directories[1]
-    logfile=directories[2]
-    dircount=directories[3]
-    tolerance=directories[4]
-    
-    files1 = os.listdir(dir1)
-    files2 = os.listdir(dir2)
-    
-    encoding = sys.getfilesystemencoding()
-    
-    modelName1 = []
-    fileName1 = []
-    for fileName in files1:
-         splits = fileName.rsplit('.', 1)
-         if len(splits) > 1:
+def BuildReferenceCache(files):
+    'build the cache of a reference result file (files[0]) in the directory files[1]'
+    try:
+        if not ReferenceCache.build(files[0], files[1]):
+            print "Result file " + files[0] + " is loaded separately for each comparison."
+    except Exception as e:
+        import traceback
+        traceback.print_exc(e,file=sys.stderr)
+        print e
+
+def resultFilesInDirectory(directory):
+    'return the model names and file names of the result files in the directory'
+    modelNames = []
+    fileNames = []
+    for fileName in os.listdir(directory):
+        splits = fileName.rsplit('.', 1)
+        if len(splits) > 1:
             if splits[1] in SimulationResult.fileExtension:
-                 modelName1.append(splits[0])
-                 fileName1.append(fileName)
-                 
-    modelName2 = []
-    fileName2 = []
-    for fileName in files2:
-            splits = fileName.rsplit('.', 1)
-            if len(splits) > 1:
-                if splits[1] in SimulationResult.fileExtension:
-                    modelName2.append(splits[0])
-                    fileName2.append(fileName) 
-    
+                modelNames.append(splits[0])
+                fileNames.append(fileName)
+    return modelNames, fileNames
+
+def compareUnitSize(unit):
+    'size of the result files of a work unit of ParallelCompareModel'
+    size = os.path.getsize(unit[0] + '/' + unit[1])
+    if unit[3] is not None:
+        size += os.path.getsize(unit[2] + '/' + unit[3])
+    return size
+
+def ParallelCompareModel(unit):
+    '''unpack the work unit and compare the result files of one model in the reference directory and a comparison directory;
+       returns the index of the comparison directory, the index of the model and the written log and html output'''
+    from StringIO import StringIO
+    from ...Simulator import SimulatorBase
+
+    dir1, fileName1, dir2, fileName2, logfile, dircount, index, tolerance, memoryBudget, referenceCacheDir, compareCacheDir = unit
+
+    encoding = sys.getfilesystemencoding()
+
+    fileOut = StringIO()
+    fileOuthtml = StringIO()
+
+    fileOut.write('\nCompare results from\n')
+    fileOut.write('  Directory 1: ' + fileName1.encode(encoding) + '\n')  # Print name of file1
+    print "\nCompare results from "
+    print "  Directory 1: " + fileName1.encode(encoding)
+
+    if fileName2 is None:
+        fileOut.write('  Directory 2: NO equivalent found\n')
+        print '  Directory 2: NO equivalent found'
+    else:
+        fileOut.write('  Directory 2: ' + fileName2.encode(encoding) + '\n')  # Print name of file2
+        print "  Directory 2: " + fileName2.encode(encoding)
+
+        file1 = dir1 + '/' + fileName1
+        file2 = dir2 + '/' + fileName2
+
+        try:
+            model1 = SimulatorBase.Model(None, None, None)
+            cacheDir = referenceCacheDir + '/' + fileName1
+            if ReferenceCache.isAvailable(cacheDir, file1):
+                model1.integrationResults = ReferenceCache.Results(cacheDir)
+            else:
+                model1.loadResultFile(file1)
+            model2 = SimulatorBase.Model(None, None, None)
+            model2.loadResultFile(file2)
+            compareCache = CompareCache.CompareCache(compareCacheDir) if compareCacheDir is not None else None
+            compareResults(model1, model2, dircount, tolerance, fileOut, fileOuthtml,logfile,file2,file1,memoryBudget,compareCache)
+        except Exception as e:
+            import traceback
+            traceback.print_exc(e,file=sys.stderr)
+            print e
+
+    return dircount, index, fileOut.getvalue(), fileOuthtml.getvalue()
+
+def ParallelCompareReport(dir1, dir2, logfile, outputs):
+    'write the log and html outputs of the work units of one comparison directory to its log and html file'
+
+    encoding = sys.getfilesystemencoding()
+
     '''create a html result file '''
     filename,fileExtension = os.path.splitext(logfile)
     logfile1=logfile.replace(fileExtension,'.html') 
@@ -1275,33 +1504,9 @@ def ParallelCompareAnalysis(directories):
     fileOut.write('  directory 1 (reference) : ' + dir1.encode(encoding) + '\n')
     fileOut.write('  directory 2 (comparison): ' + dir2.encode(encoding) + '\n')
     
-    for index, name in enumerate(modelName1):                      
-            fileOut.write('\nCompare results from\n')            
-            fileOut.write('  Directory 1: ' + fileName1[index].encode(encoding) + '\n')  # Print name of file1
-            print "\nCompare results from "
-            print "  Directory 1: " + fileName1[index].encode(encoding)
-
-            try:
-                i = modelName2.index(name)
-            except:
-                fileOut.write('  Directory 2: NO equivalent found\n')
-                print '  Directory 2: NO equivalent found'
-                i = -1
-            if i >= 0:
-                fileOut.write('  Directory 2: ' + fileName2[i].encode(encoding) + '\n')  # Print name of file2
-                print "  Directory 2: " + fileName2[i].encode(encoding)
-
-
-                file1 = dir1 + '/' + fileName1[index]
-                file2 = dir2 + '/' + fileName2[i]
-               
-                from ...Simulator import SimulatorBase 
-                
-                model1 = SimulatorBase.Model(None, None, None)
-                model1.loadResultFile(file1)
-                model2 = SimulatorBase.Model(None, None, None)
-                model2.loadResultFile(file2)
-                compareResults(model1, model2, dircount, tolerance, fileOut, fileOuthtml,logfile,file2,file1)
+    for log, html in outputs:
+        fileOut.write(log)
+        fileOuthtml.write(html)
                 
     fileOut.write('\n')    
     fileOut.write("******* Compare Analysis Completed   *******" + u"\n")
@@ -1314,7 +1519,7 @@ def ParallelCompareAnalysis(directories):
     '''open the html file to insert start html tags and add add headers of the directory name'''
     with open(logfile1) as myfile:
         htmldata=myfile.read()          
-        m1="<table><tr><th id=0>Model</th><th id=0>"+os.path.basename(os.path.dirname(file2))+'</th>'+'</tr>'
+        m1="<table><tr><th id=0>Model</th><th id=0>"+os.path.basename(dir2)+'</th>'+'</tr>'
         soup = BeautifulSoup(open(logfile1))
         data=soup.find_all('td',{"bgcolor":["#00FF00","#FF0000"]})         
         for i in xrange(len(data)):
@@ -1416,6 +1621,7 @@ class CompareThread(QtCore.QThread):
       self.logFile=os.path.join(self.logDir, "index.log").replace('\\','/')
       
       fileOut = open(self.logFile, 'w')
+      compareCache = CompareCache.CompareCache(self.compareCacheDir) if self.compareCacheDir is not None else None
       startTime = time.time()
       for dircount in xrange(len(listdirs)):
         dir2=listdirs[dircount] 
@@ -1481,7 +1687,7 @@ class CompareThread(QtCore.QThread):
                 model1.loadResultFile(file1)
                 model2 = Simulator.SimulatorBase.Model(None, None, None)
                 model2.loadResultFile(file2)
-                compareResults(model1, model2, dircount, self.tol, fileOut, fileOuthtml,self.logFile,file2,file1)
+                compareResults(model1, model2, dircount, self.tol, fileOut, fileOuthtml,self.logFile,file2,file1,self.memoryBudget,compareCache)
         
         fileOut.write('\n')    
         fileOut.write("******* Compare Analysis Completed   *******" + u"\n")
@@ -70,6 +70,7 @@ class Results(IntegrationResults.Results):
         self._name = reader.next()  # first row contains the variable names
         self._info = len(self._name) * ['']
         self._filterName()
+        self.setNameIndex(self._name, [0] * len(self._name), range(len(self._name)), [1] * len(self._name))
         data = numpy.loadtxt(csvfile, delimiter=dialect.delimiter)
 
         t = data[:, 0]
@@ -100,19 +101,22 @@ class Results(IntegrationResults.Results):
 
 
     def readData(self, variableName):
-        nameIndex = self._name.index(variableName)
-        if nameIndex < 0:
+        location = self.lookup(variableName)
+        if location is None:
             return None, None, None
-        y = self.timeSeries[0].data[:, nameIndex]
+        y = self.timeSeries[0].data[:, location[1]]
         t = self.timeSeries[0].independentVariable
         method = self.timeSeries[0].interpolationMethod
         return t, y, method
 
+    def readDataMany(self, variableNames):
+        return self._readDataManyByColumns(variableNames)
+
     def data(self, variableName):
-        nameIndex = self._name.index(variableName)
-        if nameIndex < 0:
+        location = self.lookup(variableName)
+        if location is None:
             return None
-        return self.timeSeries[0].data[:, nameIndex]
+        return self.timeSeries[0].data[:, location[1]]
 
 
     def getVariables(self):
@@ -36,6 +36,58 @@ fileExtension = 'mat'
 description = 'Dymola Simulation Result File'
 
 
+# Numeric types of the MAT-file version 4 format (digit P of the type flag MOPT)
+_matV4Types = ['f8', 'f4', 'i4', 'i2', 'u2', 'u1']
+
+
+def readMatV4Headers(fileName):
+    """ Parses only the headers of the matrices of a MAT-file version 4.
+        Returns an OrderedDict with the matrix names as keys and tuples
+        (dtype, shape, offset of the data in the file, isText) as values.
+    """
+    headers = collections.OrderedDict()
+    fileSize = os.path.getsize(fileName)
+    f = open(fileName, 'rb')
+    try:
+        offset = 0
+        while offset + 20 <= fileSize:
+            f.seek(offset)
+            header = numpy.fromfile(f, '<i4', 5)
+            if header[0] < 0 or header[0] > 4052:
+                # Big endian file
+                header = header.byteswap()
+            mopt, mrows, ncols, imagf, namlen = [int(x) for x in header]
+            if mopt < 0 or mopt > 4052 or (mopt // 100) % 10 != 0 or (mopt // 10) % 10 > 5:
+                raise WrongDymolaResultFile("File " + fileName + " is not a MAT-file version 4")
+            name = f.read(namlen).rstrip('\x00')
+            dtype = numpy.dtype(('<' if mopt // 1000 == 0 else '>') + _matV4Types[(mopt // 10) % 10])
+            dataOffset = offset + 20 + namlen
+            headers[name] = (dtype, (mrows, ncols), dataOffset, mopt % 10 == 1)
+            offset = dataOffset + mrows * ncols * dtype.itemsize * (2 if imagf else 1)
+            if offset > fileSize:
+                raise WrongDymolaResultFile("Matrix '" + name + "' is incomplete in file " + fileName)
+    finally:
+        f.close()
+    return headers
+
+
+def readMatV4Matrix(fileName, header, memoryMap=False):
+    """ Reads the matrix with the given header (see readMatV4Headers) from a MAT-file version 4.
+        Text matrices are returned as arrays of characters. If memoryMap is True, the matrix
+        is memory-mapped read-only instead of being read into memory.
+    """
+    dtype, shape, offset, isText = header
+    if memoryMap and shape[0] * shape[1] > 0 and not isText:
+        return numpy.memmap(fileName, dtype, 'r', offset, shape, 'F')
+    f = open(fileName, 'rb')
+    f.seek(offset)
+    values = numpy.fromfile(f, dtype, shape[0] * shape[1])
+    f.close()
+    if isText:
+        values = values.astype(numpy.uint8).view('S1')
+    return values.reshape(shape, order='F')
+
+
 def charArrayToStrList(charArray):
     """Transform a numpy character array to a list of strings
     """
@@ -49,6 +101,8 @@ class Results(IntegrationResults.Results):
     """ Result Object to hold a Dymola result file, see also
         class IntegrationResults.Results
     """
+    readsDataLazily = True  # The data matrix is memory-mapped
+
     def __init__(self, fileName):
         IntegrationResults.Results.__init__(self)
 
@@ -69,13 +123,13 @@ class Results(IntegrationResults.Results):
         # Determine complete file name
         fullFileName = os.path.abspath(fileName)
 
-        # Read data from file
-        fileData = scipy.io.loadmat(fullFileName, matlab_compatible=True)
+        # Read only the headers of the matrices; the data matrix data_2 is memory-mapped
+        fileData = readMatV4Headers(fullFileName)
 
         # Check Aclass array
         if not("Aclass" in fileData):
             raise WrongDymolaResultFile("Matrix 'Aclass' is missing in result file " + fullFileName)
-        Aclass = charArrayToStrList(fileData["Aclass"])
+        Aclass = charArrayToStrList(readMatV4Matrix(fullFileName, fileData["Aclass"]))
         if len(Aclass) < 3:
             raise WrongDymolaResultFile("Matrix 'Aclass' has not 3 or more rows in result file " + fullFileName)
         if Aclass[1] != "1.1":
@@ -94,11 +148,11 @@ class Results(IntegrationResults.Results):
             raise WrongDymolaResultFile("Matrix 'data_2' is not in result file " + fullFileName)
 
         # Get the raw matrices
-        name = fileData["name"]
-        description = fileData["description"]
-        dataInfo = fileData["dataInfo"]
+        name = readMatV4Matrix(fullFileName, fileData["name"])
+        description = readMatV4Matrix(fullFileName, fileData["description"])
+        dataInfo = readMatV4Matrix(fullFileName, fileData["dataInfo"]).astype(int)
         #data = [ fileData["data_1"], fileData["data_2"][:, :-1] ]
-        data = [ fileData["data_1"], fileData["data_2"] ]
+        data = [ readMatV4Matrix(fullFileName, fileData["data_1"]), readMatV4Matrix(fullFileName, fileData["data_2"], True) ]
 
         # Transpose the data, if necessary
         if len(Aclass) > 3 and Aclass[3] == "binTrans":
@@ -127,6 +181,12 @@ class Results(IntegrationResults.Results):
         self._dataInfo = dataInfo
         self._data = data
 
+        # Index of the variable names; the first occurrence of a name is used
+        self._nameRow = dict()
+        for i in xrange(len(name) - 1, -1, -1):
+            self._nameRow[name[i]] = i
+        self.setNameIndex(name, numpy.where(dataInfo[:, 0] == 1, 0, 1), numpy.abs(dataInfo[:, 1]) - 1, numpy.where(dataInfo[:, 1] >= 0, 1, -1))
+
 
         t = self.data("Time")
         data0 = data[0][0, :]
@@ -137,6 +197,14 @@ class Results(IntegrationResults.Results):
 
         self.isAvailable = True
 
+    def close(self):
+        # Release the memory-mapped data matrix, so that the file can be overwritten
+        self._data = None
+        self.timeSeries = []
+        self.nTimeSeries = 0
+        self._nameIndex = dict()
+        self.isAvailable = False
+
     def index(self, name):
         """ Return the index of variable 'name' (= full Modelica name)
 
@@ -144,26 +212,24 @@ class Results(IntegrationResults.Results):
                result = loadDymolaResult()
                i_v1   = result.index("a.b.c")   # get index of signal
         """
-        try:
-            nameIndex = self._name.index(name)
-        except ValueError:
-            return -1
-            # print("'" + name + "' is not present in the result")
-        return nameIndex
+        return self._nameRow.get(name, -1)
 
     def readData(self, variableName):
-        nameIndex = self.index(variableName)
-        if nameIndex < 0:
+        location = self.lookup(variableName)
+        if location is None:
             return None, None, None
+        seriesIndex, column, sign = location
 
-        seriesIndex = self._dataInfo[nameIndex, 0] - 1
-
-        y = self.data(variableName)
+        # Copies only the column from the memory-mapped data matrix
+        y = sign * numpy.asarray(self.timeSeries[seriesIndex].data[:, column])
         t = self.timeSeries[seriesIndex].independentVariable
         method = self.timeSeries[seriesIndex].interpolationMethod
         return t, y, method
 
 
+    def readDataMany(self, variableNames):
+        return self._readDataManyByColumns(variableNames)
+
 
     def data(self, name):
         """ Return the result values of variable 'name' (= full Modelica name)
@@ -202,7 +268,8 @@ class Results(IntegrationResults.Results):
             # n = self._data[1].shape[0]
             signalData = numpy.array([signalSign * self._data[0][0, signalColumn]])  # *numpy.ones(n)
         else:  # signalMatrix = 2
-            signalData = signalSign * self._data[1][:, signalColumn]
+            # Copies only the column from the memory-mapped data matrix
+            signalData = signalSign * numpy.asarray(self._data[1][:, signalColumn])
         return signalData
 
 
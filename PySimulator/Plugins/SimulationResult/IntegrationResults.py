@@ -25,6 +25,8 @@ along with PySimulator. If not, see www.gnu.org/licenses.
 
 
 import os
+import collections
+import numpy
 
 
 class TimeSeries():
@@ -51,6 +53,9 @@ class ResultVariable():
 class Results():
     ''' Base Class for hosting simulation results of each type.
     '''
+    readsDataLazily = False  # True, if the plugin reads only the requested parts of the data from file
+    #                          (e.g. memory-mapped or by readTimeSeriesData)
+
     def __init__(self):
         ''' Set important variables to default values
         '''
@@ -60,6 +65,7 @@ class Results():
         #                                  result file although simulation is not finished
         self.nTimeSeries = 0
         self.timeSeries = []
+        self._nameIndex = None  # Dictionary variable name -> (seriesIndex, column, sign)
 
 
     def readData(self, variableName):
@@ -74,6 +80,79 @@ class Results():
         pass
         # return t, y, method  # Types  numpy-array, numpy-array, String
 
+    def readDataMany(self, variableNames):
+        ''' Returns a list with the tuple (t, y, method) of readData for each
+            variable in variableNames ((None, None, None) for unknown variables).
+            Plugins shall overwrite this function if several variables can be
+            read more efficiently at once, e.g. by _readDataManyByColumns.
+        '''
+        return [self.readData(name) for name in variableNames]
+
+    def _readDataManyByColumns(self, variableNames):
+        ''' Implementation of readDataMany based on the name index: The requested
+            columns of each time series are read by one call of readTimeSeriesData
+            and all variables of a time series share its independent variable.
+        '''
+        locations = self.lookupMany(variableNames)
+        members = collections.OrderedDict()
+        for k, location in enumerate(locations):
+            if location is not None:
+                members.setdefault(location[0], []).append(k)
+        result = [(None, None, None)] * len(variableNames)
+        for seriesIndex, ks in members.iteritems():
+            data = numpy.asarray(self.readTimeSeriesData(seriesIndex, [locations[k][1] for k in ks]))
+            t = self.timeSeries[seriesIndex].independentVariable
+            method = self.timeSeries[seriesIndex].interpolationMethod
+            for m, k in enumerate(ks):
+                result[k] = (t, locations[k][2] * data[:, m], method)
+        return result
+
+    def readTimeSeriesData(self, seriesIndex, columns, rowStart=0, rowStop=None):
+        ''' Returns the rows rowStart:rowStop of the given columns of the
+            data matrix of time series seriesIndex as numpy array.
+            Plugins that do not keep the data matrix in memory shall overwrite
+            this function to read only the requested part from the file.
+        '''
+        return self.timeSeries[seriesIndex].data[rowStart:rowStop, columns]
+
+    def setNameIndex(self, names, seriesIndex, column, sign):
+        ''' Builds the index of variable names used by lookup and lookupMany:
+            Variable names[i] is stored in column column[i] of time series
+            seriesIndex[i] with sign sign[i]. If a name occurs more than once,
+            its first occurrence is used.
+        '''
+        self._nameIndex = dict()
+        for i in xrange(len(names) - 1, -1, -1):
+            self._nameIndex[names[i]] = (int(seriesIndex[i]), int(column[i]), int(sign[i]))
+
+    def lookup(self, variableName):
+        ''' Returns the tuple (seriesIndex, column, sign) of the variable
+            variableName, or None if the variable is not in the result.
+        '''
+        return self.lookupMany([variableName])[0]
+
+    def lookupMany(self, variableNames):
+        ''' Returns a list with the tuple (seriesIndex, column, sign) for each
+            of the variables in variableNames (None for unknown variables).
+            Plugins build the index with setNameIndex when opening the result;
+            otherwise it is built once from getVariables.
+        '''
+        if getattr(self, '_nameIndex', None) is None:
+            variables = self.getVariables()
+            if variables is None:
+                variables = dict()
+            self._nameIndex = dict((name, (x.seriesIndex, x.column, x.sign)) for name, x in variables.iteritems())
+        get = self._nameIndex.get
+        return [get(name) for name in variableNames]
+
+    def getNameIndex(self):
+        ''' Returns a dictionary with names of variables as keys and the tuple
+            (seriesIndex, column, sign) as values (see lookupMany). Unlike getVariables,
+            no data is read if the plugin builds the index with setNameIndex.
+        '''
+        self.lookupMany([])
+        return self._nameIndex
+
     def getVariables(self):
         ''' Returns a dictionary with names of variables as keys
             and instances of ResultVariable as values. This
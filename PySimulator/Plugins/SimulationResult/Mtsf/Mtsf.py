@@ -41,15 +41,47 @@ description = 'MA Time Series File Format'
 class Results(IntegrationResults.Results):
     ''' Result file object for an MTSF file
     '''
+    readsDataLazily = True  # Hyperslabs are read by readTimeSeriesData
 
-    def __init__(self, resultFileName, modelDescription=None, modelVariables=None, experimentSetup=None, simpleTypes=None, units=None, enumerations=None):
+
+    def __init__(self, resultFileName, modelDescription=None, modelVariables=None, experimentSetup=None, simpleTypes=None, units=None, enumerations=None, layout=None):
         IntegrationResults.Results.__init__(self)
 
-        self._mtsf = pyMtsf.MTSF(resultFileName, modelDescription, modelVariables, experimentSetup, simpleTypes, units, enumerations)
+        self._mtsf = pyMtsf.MTSF(resultFileName, modelDescription, modelVariables, experimentSetup, simpleTypes, units, enumerations, layout)
 
         self.fileName = self._mtsf.fileName
         self.canLoadPartialData = True
         self.isAvailable = self._mtsf.file is not None
+        if self.isAvailable and self._mtsf.access == 'read':
+            self._readTimeSeries()
+            self._setNameIndex()
+
+    def _readTimeSeries(self):
+        ''' Creates the time series of the file without reading their data matrices
+        '''
+        if len(self.timeSeries) == 0:
+            self._mtsf.readVariableList()
+            for series in self._mtsf.file['/Results'].itervalues():
+                row = series.attrs['independentVariableRow']
+                interpolationMethod = series.attrs['interpolationMethod']
+                if row < 0:
+                    independentVariable = None
+                else:
+                    independentVariable, trash, trash = self.readData(self._mtsf.fileData.nameList[row])
+                for category in series.itervalues():
+                    self.timeSeries.append(IntegrationResults.TimeSeries(independentVariable, None, interpolationMethod))
+                    self.timeSeries[-1].name = category.name
+
+            self.nTimeSeries = len(self.timeSeries)
+
+    def _setNameIndex(self):
+        ''' Builds the name index from the variable list of the file
+        '''
+        fileData = self._mtsf.fileData
+        timeSeriesIndex = dict((x.name, i) for i, x in enumerate(self.timeSeries))
+        seriesIndex = [timeSeriesIndex[self._mtsf.file[objectId].name] for objectId in fileData.objectIdList]
+        sign = [-1 if negated else 1 for negated in fileData.negatedList]
+        self.setNameIndex(fileData.nameList, seriesIndex, fileData.columnList, sign)
 
     def close(self):
         self._mtsf.close()
@@ -57,6 +89,21 @@ class Results(IntegrationResults.Results):
     def readData(self, variableName):
         return self._mtsf.readData(variableName)
 
+    def readDataMany(self, variableNames):
+        if not self.isAvailable or self._mtsf.access == 'write':
+            # Data of a running simulation is partly buffered in memory
+            return [self._mtsf.readData(name) for name in variableNames]
+        # One hyperslab per dataset (see readTimeSeriesData) for all requested columns
+        return self._readDataManyByColumns(variableNames)
+
+    def readTimeSeriesData(self, seriesIndex, columns, rowStart=0, rowStop=None):
+        if self.timeSeries[seriesIndex].data is not None:
+            return IntegrationResults.Results.readTimeSeriesData(self, seriesIndex, columns, rowStart, rowStop)
+        # Read the data from file; h5py needs increasing column indices
+        uniqueColumns, inverse = numpy.unique(columns, return_inverse=True)
+        data = self._mtsf.file[self.timeSeries[seriesIndex].name][rowStart:rowStop, uniqueColumns.tolist()]
+        return data[:, inverse]
+
     def getFileInfos(self):
         return self._mtsf.getResultAttributes()
 
@@ -80,26 +127,15 @@ class Results(IntegrationResults.Results):
             DataTypeStrings[k] = i
 
 
-        if len(self.timeSeries) == 0:
-            for series in self._mtsf.file['/Results'].itervalues():
-                row = series.attrs['independentVariableRow']
-                interpolationMethod = series.attrs['interpolationMethod']
-                if row < 0:
-                    independentVariable = None
-                else:
-                    independentVariable, trash, trash = self.readData(self._mtsf.fileData.nameList[row])
-                for category in series.itervalues():
-                    if category.size > 5000000:
-                        data = None  # Memory problem for huge files
-                    else:
-                        data = numpy.array(category)
-                    self.timeSeries.append(IntegrationResults.TimeSeries(independentVariable, data, interpolationMethod))
-                    self.timeSeries[-1].name = category.name
-
-            self.nTimeSeries = len(self.timeSeries)
+        self._readTimeSeries()
+        for series in self.timeSeries:
+            if series.data is None:
+                category = self._mtsf.file[series.name]
+                if category.size <= 5000000:  # Memory problem for huge files
+                    series.data = numpy.array(category)
 
 
-        timeSeriesNameList = [x.name for x in self.timeSeries]
+        timeSeriesIndex = dict((x.name, i) for i, x in enumerate(self.timeSeries))
 
         # Generate the dict
         variables = dict()
@@ -138,7 +174,7 @@ class Results(IntegrationResults.Results):
                 unit = None
 
             objectId = self._mtsf.fileData.objectIdList[i]
-            seriesIndex = timeSeriesNameList.index(self._mtsf.file[objectId].name)
+            seriesIndex = timeSeriesIndex[self._mtsf.file[objectId].name]
             column = self._mtsf.fileData.columnList[i]
             sign = -1 if self._mtsf.fileData.negatedList[i] else 1
             variables[name] = IntegrationResults.ResultVariable(value, unit, variability, infos, seriesIndex, column, sign)
@@ -47,6 +47,8 @@ Proc. of 9th International Modelica Conference, Munich, Germany, Sept. 2012.
 
 import h5py
 import numpy
+import threading
+import Queue
 
 
 
@@ -198,6 +200,47 @@ def ExperimentSetup(startTime, stopTime, algorithm, relativeTolerance, author, d
     return ret
 
 
+class DatasetLayout:
+    ''' Class defining the chunking and compression of the datasets in /Results.
+        The chunks are blocks of chunkColumns columns (and as many rows as fit into
+        chunkBytes), so that reading a single variable touches only the chunks
+        of its column block and not the complete dataset.
+            compression         'none', 'lzf' or 'gzip'
+            compressionLevel    level of gzip compression (0 ... 9)
+            chunkColumns        number of columns of a chunk
+            chunkBytes          size of a chunk in bytes
+    '''
+    def __init__(self, compression='gzip', compressionLevel=4, chunkColumns=16, chunkBytes=262144):
+        if compression not in ['none', 'lzf', 'gzip']:
+            raise ValueError("Unknown compression '" + str(compression) + "' for MTSF datasets")
+        self.compression = compression
+        self.compressionLevel = compressionLevel
+        self.chunkColumns = chunkColumns
+        self.chunkBytes = chunkBytes
+
+    def chunks(self, nColumn, itemSize, expectedRows=0):
+        ''' Returns the chunk shape of a dataset with nColumn columns that is expected
+            to hold expectedRows rows in the end (0: unknown). The chunk rows do not depend
+            on the initial size of the dataset, since a chunk of a resizable dataset may
+            be larger than its current extent.
+        '''
+        columns = max(min(self.chunkColumns, nColumn), 1)
+        rows = max(self.chunkBytes / (itemSize * columns), 1)
+        if expectedRows > 0:
+            # Do not allocate chunks larger than the final size of small datasets
+            rows = min(rows, expectedRows)
+        return (rows, columns)
+
+    def compressionArguments(self):
+        ''' Returns the keyword arguments for h5py's create_dataset defining the compression
+        '''
+        if self.compression == 'none':
+            return dict()
+        if self.compression == 'lzf':
+            return dict(compression='lzf')
+        return dict(compression='gzip', compression_opts=self.compressionLevel)
+
+
 class Category:
     ''' Class to handle a category. A category is a dataset of a time series group.
     '''
@@ -207,15 +250,21 @@ class Category:
         self.currentRow = 0
         self.name = name
         self.series = series
-
-    def writeInitial(self, host, initialRows):
-        # compression = None
-        compression = "gzip"
-        if self.name != 'H5T_C_S1':
-            if self.nColumn >= 8:
-                compression = "gzip"
-                # compression = None
-        self.dataset = host.create_dataset(self.name, shape=(initialRows, self.nColumn), dtype=eval('h5py.h5t.' + self.name[4:]), maxshape=(None, None), compression=compression)  # chunks=(c1,c2))
+        self.resizeCount = 0
+
+    def writeInitial(self, host, initialRows, layout=None):
+        if layout is None:
+            layout = DatasetLayout()
+        dtype = eval('h5py.h5t.' + self.name[4:])
+        if self.series is not None and self.series.independentVariable is None:
+            # Datasets without independent variable (e.g. parameters) keep their initial size
+            expectedRows = initialRows
+        elif self.series is not None:
+            expectedRows = self.series.estimateRows()
+        else:
+            expectedRows = 0
+        chunks = layout.chunks(self.nColumn, numpy.dtype(dtype).itemsize, expectedRows)
+        self.dataset = host.create_dataset(self.name, shape=(initialRows, self.nColumn), dtype=dtype, maxshape=(None, None), chunks=chunks, **layout.compressionArguments())
         self._data = numpy.zeros((max(min(10000000 / self.nColumn, initialRows), 1), self.nColumn))
         self._currentRow = 0
 
@@ -248,36 +297,40 @@ class Category:
             useInternalData = True
             dataMatrix = self._data
         if dataMatrix.ndim == 1:
-            if 1 + self.currentRow > self.dataset.shape[0]:
-                # Increase space about 30%
-                # print "Increasing space"
-                newSize = self.dataset.shape[0] + max(self.dataset.shape[0] * 3 / 10, 1)
-                self.dataset.resize(newSize, axis=0)
-            # Write data
-            if useInternalData:
-                row = self._currentRow
-            else:
-                row = 1
-            if row > 0:
-                self.dataset[self.currentRow:self.currentRow + row, :] = dataMatrix[0:row, :]
+            dataMatrix = dataMatrix.reshape((1, dataMatrix.shape[0]))
+        if useInternalData:
+            row = self._currentRow
         else:
-            if dataMatrix.shape[0] + self.currentRow > self.dataset.shape[0]:
-                # Increase space about 30%
-                # print "Increasing space"
-                newSize = self.dataset.shape[0] + max(self.dataset.shape[0] * 3 / 10, dataMatrix.shape[0])
-                self.dataset.resize(newSize, axis=0)
-            # Write data
-            if useInternalData:
-                row = self._currentRow
-            else:
-                row = dataMatrix.shape[0]
-            if row > 0:
-                self.dataset[self.currentRow:self.currentRow + row, :] = dataMatrix[0:row, :]
+            row = dataMatrix.shape[0]
+        if row + self.currentRow > self.dataset.shape[0]:
+            self._grow(row + self.currentRow)
+        # Write data
+        if row > 0:
+            self.dataset[self.currentRow:self.currentRow + row, :] = dataMatrix[0:row, :]
+            if self.series is not None and self is self.series.timeCategory:
+                self.series.setProgress(self.currentRow + row, dataMatrix[row - 1, self.series.timeColumn])
 
         self.currentRow += row
         # Reset internal data
         self._currentRow = 0
 
+    def _grow(self, requiredRows):
+        ''' Enlarges the dataset to at least requiredRows rows. The new size is
+            the larger one of 1.5 times the current size and the number of rows
+            expected at stopTime (from the rate of rows written so far),
+            rounded up to a multiple of the chunk rows.
+        '''
+        size = self.dataset.shape[0]
+        newSize = max(requiredRows, size * 3 / 2)
+        if self.series is not None:
+            # Limit the estimate, since a burst of events at the start extrapolates badly
+            newSize = max(newSize, min(self.series.estimateRows(), 4 * max(size, requiredRows)))
+        if self.dataset.chunks is not None:
+            chunkRows = self.dataset.chunks[0]
+            newSize = ((newSize + chunkRows - 1) / chunkRows) * chunkRows
+        self.dataset.resize(newSize, axis=0)
+        self.resizeCount += 1
+
     def close(self):
         if self._currentRow > 0:
             self._writeDataToFile()
@@ -299,26 +352,138 @@ class Series:
         self.handle = None
         self.initialRows = initialRows
         self.independentVariableRow = -2
+        # Dataset and column holding the independent variable, and the progress of writing
+        self.timeCategory = None
+        self.timeColumn = -1
+        self.startTime = None
+        self.stopTime = None
+        self.writtenRows = 0
+        self.currentTime = None
 
     def writeInitial(self, mtfs):
         # Create HDF5 group for series
         self.handle = mtfs.resultsHandle.create_group(self.name)
         self.handle.attrs['interpolationMethod'] = self.interpolationMethod
         for category in self.category.values():
-                category.writeInitial(self.handle, self.initialRows)
+                category.writeInitial(self.handle, self.initialRows, mtfs.layout)
 
     def writeIndependentVariable(self, mtfs):
         # Set link to independent variable
         if self.independentVariable is not None:
             self.independentVariableRow = mtfs.modelVariable[self.independentVariable].rowIndex
+            self.timeCategory = mtfs.modelVariable[self.independentVariable].category
+            self.timeColumn = mtfs.modelVariable[self.independentVariable].columnIndex
+            try:
+                self.startTime = float(mtfs.experimentSetup['startTime'])
+                self.stopTime = float(mtfs.experimentSetup['stopTime'])
+            except (TypeError, KeyError, ValueError):
+                self.startTime = None
+                self.stopTime = None
         else:
             self.independentVariableRow = -1
         self.handle.attrs['independentVariableRow'] = self.independentVariableRow
 
+    def setProgress(self, rows, time):
+        ''' Records that rows rows up to the independent variable value time are written
+        '''
+        self.writtenRows = rows
+        self.currentTime = float(time)
+
+    def estimateRows(self):
+        ''' Returns the number of rows expected at stopTime, extrapolated from
+            the rows written so far; 0 if there is no estimate yet
+        '''
+        if self.startTime is None or self.currentTime is None:
+            return 0
+        elapsed = self.currentTime - self.startTime
+        if elapsed <= 0 or self.currentTime >= self.stopTime:
+            return 0
+        return int(self.writtenRows * (self.stopTime - self.startTime) / elapsed) + 1
+
     def close(self):
         for category in self.category.values():
             category.close()
 
+    def resizeCount(self):
+        ''' Returns the number of times the datasets of the series were enlarged
+        '''
+        return sum(category.resizeCount for category in self.category.values())
+
+
+class BackgroundWriter:
+    ''' Writes the rows of categories in a separate thread.
+        The caller only copies the values into preallocated blocks of blockRows
+        rows; full blocks are passed by a bounded queue to a thread that writes
+        them by Category.writeData (i.e. compresses them and writes them to the
+        HDF5 file). If the file cannot keep up, append waits for a free block,
+        so that at most nBlocks blocks per category are held in memory.
+            semaphore   guards the categories against concurrent readers (or None)
+    '''
+    def __init__(self, categories, semaphore=None, blockRows=256, nBlocks=4):
+        self.semaphore = semaphore
+        self._ring = dict()
+        for category in categories:
+            rows = max(1, min(blockRows, 10000000 / max(category.nColumn, 1)))
+            free = Queue.Queue()
+            for i in xrange(nBlocks):
+                free.put(numpy.zeros((rows, category.nColumn)))
+            # [free blocks, current block, number of rows in current block]
+            self._ring[category] = [free, free.get(), 0]
+        self._full = Queue.Queue(max(1, nBlocks * len(self._ring)))
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def append(self, category, values):
+        ''' Appends one row of values to category
+        '''
+        ring = self._ring[category]
+        block = ring[1]
+        block[ring[2], :] = values
+        ring[2] += 1
+        if ring[2] == block.shape[0]:
+            self._pass(category, ring)
+
+    def _pass(self, category, ring):
+        if self._error is not None:
+            raise self._error
+        self._full.put((category, ring[1], ring[2]))
+        ring[1] = ring[0].get()
+        ring[2] = 0
+
+    def _run(self):
+        while True:
+            item = self._full.get()
+            if item is None:
+                break
+            category, block, rows = item
+            if self._error is None:
+                if self.semaphore is not None:
+                    self.semaphore.acquire()
+                try:
+                    category.writeData(block[:rows, :])
+                except Exception as e:
+                    self._error = e
+                finally:
+                    if self.semaphore is not None:
+                        self.semaphore.release()
+            self._ring[category][0].put(block)
+
+    def close(self):
+        ''' Passes the rows not yet written and waits until all rows are written
+        '''
+        if self._thread is None:
+            return
+        for category, ring in self._ring.iteritems():
+            if ring[2] > 0:
+                self._pass(category, ring)
+        self._full.put(None)
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise self._error
+
 
 
 class Results:
@@ -363,6 +528,11 @@ class Results:
                     scalar.columnIndex = self.series[seriesName].category[categoryName].nColumn - 1
                     scalar.category = self.series[seriesName].category[categoryName]
 
+    def resizeCount(self):
+        ''' Returns the number of times the datasets of all series were enlarged
+        '''
+        return sum(series.resizeCount() for series in self.series.values())
+
 
 class FileData:
     ''' Class to hold some information when reading an MTSF file
@@ -370,6 +540,7 @@ class FileData:
     def __init__(self):
         self.variables = None
         self.nameList = None
+        self.nameRow = None  # Dictionary variable name -> row in nameList
         self.objectIdList = None
         self.columnList = None
         self.negatedList = None
@@ -380,7 +551,7 @@ class FileData:
 class MTSF:
     ''' This is the main class to write and read files in MTSF format
     '''
-    def __init__(self, resultFileName, modelDescription=None, modelVariables=None, experimentSetup=None, simpleTypes=None, units=None, enumerations=None):
+    def __init__(self, resultFileName, modelDescription=None, modelVariables=None, experimentSetup=None, simpleTypes=None, units=None, enumerations=None, layout=None):
         '''                              Type
             resultFileName               String
             modelDescription             ModelDescription
@@ -389,6 +560,7 @@ class MTSF:
             simpleTypes                  list of SimpleTypes
             units                        list of Units
             enumerations                 list of Enumerations
+            layout                       DatasetLayout (None: default layout)
 
             If modelDescription is not None then /ModelDescription is written, also the structure of /Results
             Otherwise the file given by resultFileName is opened for reading.
@@ -421,6 +593,7 @@ class MTSF:
         self.simpleTypes = simpleTypes
         self.units = units
         self.enumerations = enumerations
+        self.layout = DatasetLayout() if layout is None else layout
 
         # Create hdf5 file
         try:
@@ -614,6 +787,10 @@ class MTSF:
             self.fileData.variables = self.file["ModelDescription/Variables"]
         if self.fileData.nameList is None:
             self.fileData.nameList = self.fileData.variables["name", :, 0].tolist()
+        if self.fileData.nameRow is None:
+            self.fileData.nameRow = dict()
+            for i in xrange(len(self.fileData.nameList) - 1, -1, -1):
+                self.fileData.nameRow[self.fileData.nameList[i]] = i
         if self.fileData.objectIdList is None:
             self.fileData.objectIdList = self.fileData.variables["objectId", :, 0].tolist()
         if self.fileData.columnList is None:
@@ -638,7 +815,9 @@ class MTSF:
 
 
         self.readVariableList()
-        variableRowIndex = self.fileData.nameList.index(variableName)
+        variableRowIndex = self.fileData.nameRow.get(variableName)
+        if variableRowIndex is None:
+            return None, None, None
         seriesOfVariable = self.file[self.fileData.objectIdList[variableRowIndex]].parent.ref
         method = self.file[seriesOfVariable].attrs["interpolationMethod"]
         if self.access == 'write':
@@ -713,6 +892,56 @@ class MTSF:
 
 
 
-
-
-
+if __name__ == '__main__':
+    # Benchmark: latency of reading a single variable from a large result file for different dataset layouts
+
+    import time
+    import os
+    import collections
+
+    nRows = 20000
+    nColumns = 2000
+    nReads = 20
+
+    data = numpy.random.rand(nRows, nColumns)
+    data[:, 0] = numpy.linspace(0.0, 1.0, nRows)
+
+    layouts = [('automatic chunks, gzip', None),
+               ('column blocks of 1, none', DatasetLayout('none', chunkColumns=1)),
+               ('column blocks of 16, none', DatasetLayout('none', chunkColumns=16)),
+               ('column blocks of 16, lzf', DatasetLayout('lzf', chunkColumns=16)),
+               ('column blocks of 16, gzip 4', DatasetLayout('gzip', 4, chunkColumns=16)),
+               ('column blocks of 64, gzip 1', DatasetLayout('gzip', 1, chunkColumns=64))]
+
+    for description, layout in layouts:
+        variable = collections.OrderedDict()
+        variable['Time'] = ScalarModelVariable('Time', 'input', 0, 'continuous', 0, 0)
+        for i in xrange(1, nColumns):
+            variable['x' + str(i)] = ScalarModelVariable('', 'local', 0, 'continuous', 0, 0)
+        modelVariables = ModelVariables(variable, [Series('Continuous', 'Time', 'linear', nRows)], StandardCategoryNames)
+        simpleTypes = [SimpleType('Real without unit', DataType['Real'], '', False, -1, '')]
+        experimentSetup = ExperimentSetup(startTime=0.0, stopTime=1.0, algorithm="", relativeTolerance='',
+                                          author="", description="Benchmark", generationDateAndTime="",
+                                          generationTool="Python", machine="", cpuTime="")
+        fileName = 'benchmarkLayout.mtsf'
+        mtsf = MTSF(fileName, ModelDescription('benchmarkLayout', '', '', '', '', '', 'structured'), modelVariables, experimentSetup, simpleTypes, [], [], None if layout is None else layout)
+        if layout is None:
+            # Chunking chosen by h5py as before the introduction of DatasetLayout
+            dataset = mtsf.results.series['Continuous'].category[CategoryMapping['Real']]
+            del mtsf.results.series['Continuous'].handle[dataset.name]
+            dataset.dataset = mtsf.results.series['Continuous'].handle.create_dataset(dataset.name, shape=(nRows, nColumns), dtype=numpy.float64, maxshape=(None, None), compression='gzip')
+        startTime = time.time()
+        mtsf.results.series['Continuous'].category[CategoryMapping['Real']].writeData(data)
+        mtsf.close()
+        writeTime = time.time() - startTime
+
+        names = ['x' + str(i) for i in numpy.random.randint(1, nColumns, nReads)]
+        startTime = time.time()
+        for name in names:
+            # Open the file for each read to avoid measuring the HDF5 chunk cache
+            result = MTSF(fileName)
+            t, y, method = result.readData(name)
+            result.close()
+        readTime = (time.time() - startTime) / nReads
+        print "%-30s write: %7.3f s   read one variable: %8.2f ms   file size: %7.1f MB" % (description, writeTime, readTime * 1000, os.path.getsize(fileName) / 1048576.0)
+        os.remove(fileName)
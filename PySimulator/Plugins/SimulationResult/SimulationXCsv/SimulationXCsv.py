@@ -114,6 +114,10 @@ class Results(IntegrationResults.Results):
 
         self.nTimeSeries = len(self.timeSeries)
 
+        nColumns = self.timeSeries[0].data.shape[1]
+        self.setNameIndex(self._name, [1 if x else 0 for x in self._isParameter],
+                          [i - nColumns if self._isParameter[i] else i for i in xrange(len(self._name))], [1] * len(self._name))
+
 
         # Hack to transform deg -> rad
         for i in xrange(len(self._unit)):
@@ -153,21 +157,20 @@ class Results(IntegrationResults.Results):
 
 
     def readData(self, variableName):
-        nameIndex = self._name.index(variableName)
-        if nameIndex < 0:
+        location = self.lookup(variableName)
+        if location is None:
             return None, None, None
-        if self._isParameter[nameIndex]:
-            y = numpy.array([self.timeSeries[1].data[0, nameIndex - self.timeSeries[0].data.shape[1]]])
-            i = 1
-        else:
-            y = self.timeSeries[0].data[:, nameIndex]
-            i = 0
+        i, column, sign = location
+        y = self.timeSeries[i].data[:, column]
 
         t = self.timeSeries[i].independentVariable
         method = self.timeSeries[i].interpolationMethod
 
         return t, y, method
 
+    def readDataMany(self, variableNames):
+        return self._readDataManyByColumns(variableNames)
+
 
     def getVariables(self):
         # Generate the dict
@@ -126,6 +126,7 @@ class Results(IntegrationResults.Results):
 				self._fileInfo['Columns'] = str(cols)
 				self.timeSeries.append(IntegrationResults.TimeSeries(doc_t, data, "linear"))
 				self._filterUnit()
+				self.setNameIndex(self._name, [0] * len(self._name), range(len(self._name)), [1] * len(self._name))
 				self.isAvailable = True  # Shows, if there is a file available to be read
 			else:
 				raise Exception('No results stored in file ' + self._fullFileName)
@@ -140,10 +141,10 @@ class Results(IntegrationResults.Results):
 				self._unit[i] = None
 
 	def readData(self, variableName):
-		nameIndex = self._name.index(variableName)
-		if nameIndex < 0:
+		location = self.lookup(variableName)
+		if location is None:
 			return None, None, None
-		y = self.timeSeries[0].data[:, nameIndex]
+		y = self.timeSeries[0].data[:, location[1]]
 		t = self.timeSeries[0].independentVariable
 		method = self.timeSeries[0].interpolationMethod
 
@@ -0,0 +1,352 @@
+﻿#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Copyright (C) 2011-2015 German Aerospace Center DLR
+(Deutsches Zentrum fuer Luft- und Raumfahrt e.V.),
+Institute of System Dynamics and Control
+All rights reserved.
+
+This file is part of PySimulator.
+
+PySimulator is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PySimulator is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with PySimulator. If not, see www.gnu.org/licenses.
+'''
+
+
+'''
+***************************
+Co-Simulation of several connected FMUs for CoSimulation (FMI 2.0).
+
+The FMUs and their connections are read from a connection description, e.g.
+
+    [Experiment]
+    startTime = 0.0
+    stopTime = 10.0
+    stepSize = 0.001
+    resultFileName = Controlled.mtsf
+
+    [FMUs]
+    controller = Controller.fmu
+    plant = Plant.fmu
+
+    [Connections]
+    plant.u = controller.y
+    controller.u_m = plant.y
+
+Each connection sets the input on the left hand side to the output on the right hand side.
+File names are relative to the directory of the connection description.
+At each communication point the doStep functions of all FMUs are called concurrently
+(ctypes releases the GIL while the FMU computes), then the outputs are copied to the
+connected inputs. The results of all FMUs are written to one MTSF result file, the
+variables are prefixed by the instance names.
+***************************
+'''
+
+
+import collections
+import getpass
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
+import FMUInterface2 as FMUInterface
+from FMUError import FMUError
+from ...SimulationResult.Mtsf import Mtsf
+from ...SimulationResult.Mtsf import MtsfFmi2
+from ...SimulationResult.Mtsf import pyMtsf
+from ...Simulator.FMUSimulator.FMUInterface2 import fmiTrue, fmiFalse
+
+
+def _dataType(scalarVariable):
+    ''' Returns the data type of scalarVariable used to exchange its value
+    '''
+    basicType = scalarVariable.type.basicType
+    if basicType == 'Enumeration':
+        return 'Integer'
+    return basicType
+
+
+class Exchange:
+    ''' Copies the values of outputs of one FMU to inputs of another FMU
+    '''
+    def __init__(self, source, target, dataType, sourceReferences, targetReferences):
+        self.gather = source.bindGather(sourceReferences, dataType)
+        self.targetReferences = numpy.array(targetReferences, dtype=numpy.uint32)
+        if dataType == 'Real':
+            self._set = target.fmiSetReal
+        elif dataType == 'Integer':
+            self._set = target.fmiSetInteger
+        else:
+            self._set = target.fmiSetBoolean
+
+    def transfer(self):
+        status, values = self.gather.get()
+        return max(status, self._set(self.targetReferences, values))
+
+
+class ResultRow:
+    ''' Gathers the values of one category of the result file from all FMUs into a preallocated row
+    '''
+    def __init__(self, category, nColumn):
+        self.category = category
+        self.values = numpy.zeros(nColumn)
+        self.parts = []
+        self.timeColumn = None
+
+    def get(self, t):
+        for columns, gather in self.parts:
+            status, values = gather.get()
+            self.values[columns] = values
+        if self.timeColumn is not None:
+            self.values[self.timeColumn] = t
+        return self.values
+
+
+class ConnectedFMUs:
+    ''' Master for the Co-Simulation of FMUs connected by a connection description
+    '''
+    def __init__(self, fileName, loggingOn=False):
+        import configobj
+
+        self.fileName = fileName
+        self.stopRequest = False  # Set to True (e.g. by another thread) to stop the simulation
+        self.name = os.path.splitext(os.path.basename(fileName))[0]
+        path = os.path.dirname(os.path.abspath(fileName))
+        config = configobj.ConfigObj(fileName, encoding='utf8')
+
+        experiment = config.get('Experiment', {})
+        self.startTime = float(experiment.get('startTime', 0.0))
+        self.stopTime = float(experiment.get('stopTime', 1.0))
+        self.stepSize = float(experiment.get('stepSize', (self.stopTime - self.startTime) / 500))
+        self.resultFileName = os.path.join(path, experiment.get('resultFileName', self.name + '.mtsf'))
+
+        # Load the FMUs
+        self.instances = collections.OrderedDict()
+        try:
+            for instanceName, fmuFileName in config['FMUs'].items():
+                interface = FMUInterface.FMUInterface(os.path.join(path, fmuFileName), None, loggingOn, 'cs')
+                self.instances[instanceName] = interface
+                if interface.activeFmiType != 'cs':
+                    raise FMUError('FMU ' + fmuFileName + ' does not support CoSimulation.\n')
+
+            # Group the connections by source, target and data type
+            connections = collections.OrderedDict()
+            for targetName, sourceName in config.get('Connections', {}).items():
+                target, targetVariable = self._getVariable(targetName)
+                source, sourceVariable = self._getVariable(sourceName)
+                dataType = _dataType(sourceVariable)
+                if dataType != _dataType(targetVariable) or dataType == 'String':
+                    raise FMUError('Cannot connect ' + sourceName + ' to ' + targetName + ': incompatible data types.\n')
+                if targetVariable.causality != 'input':
+                    raise FMUError('Cannot connect to ' + targetName + ': it is not an input.\n')
+                key = (source, target, dataType)
+                if key not in connections:
+                    connections[key] = ([], [])
+                connections[key][0].append(int(sourceVariable.valueReference))
+                connections[key][1].append(int(targetVariable.valueReference))
+            self.exchanges = [Exchange(self.instances[source], self.instances[target], dataType, sourceReferences, targetReferences)
+                              for (source, target, dataType), (sourceReferences, targetReferences) in connections.items()]
+        except:
+            self.close()
+            raise
+
+    def _getVariable(self, name):
+        ''' Returns instance name and scalar variable for a name of the form instance.variable
+        '''
+        instanceName, variableName = name.split('.', 1)
+        if instanceName not in self.instances:
+            raise FMUError('Unknown FMU instance ' + instanceName + ' in connection description.\n')
+        scalarVariables = self.instances[instanceName].description.scalarVariables
+        if variableName not in scalarVariables:
+            raise FMUError('Unknown variable ' + name + ' in connection description.\n')
+        return instanceName, scalarVariables[variableName]
+
+    def close(self):
+        ''' Releases all FMUs
+        '''
+        for interface in self.instances.values():
+            interface.free()
+        self.instances.clear()
+
+    def exchangeValues(self):
+        ''' Sets all inputs to the values of the connected outputs
+        '''
+        status = 0
+        for exchange in self.exchanges:
+            status = max(status, exchange.transfer())
+        return status
+
+    def _prepareResultFile(self, resultFileName, startTime, stopTime, stepSize):
+        ''' Creates the result file for the variables of all FMUs and returns it
+            together with a ResultRow for each category
+        '''
+        variable = collections.OrderedDict()
+        origin = dict()
+        for k, (instanceName, interface) in enumerate(self.instances.items()):
+            (modelDescription, modelVariables, simpleTypes, units, enumerations) = MtsfFmi2.convertFromFmi('', interface.description)
+            if k == 0:
+                # The simple types are the same for all FMUs
+                variable['Time'] = modelVariables.variable['Time']
+                variable['TimeDiscrete'] = modelVariables.variable['TimeDiscrete']
+                allSimpleTypes, allUnits, allEnumerations = simpleTypes, units, enumerations
+            for name, scalar in modelVariables.variable.items():
+                if name in interface.description.scalarVariables:
+                    if scalar.aliasName is not None:
+                        scalar.aliasName = instanceName + '.' + scalar.aliasName
+                    variable[instanceName + '.' + name] = scalar
+                    origin[instanceName + '.' + name] = (interface, int(interface.description.scalarVariables[name].valueReference))
+
+        modelDescription = pyMtsf.ModelDescription(self.name, 'Connected FMUs of ' + os.path.basename(self.fileName), getpass.getuser(), '',
+                                                   'PySimulator', time.strftime("%a, %d %b %Y %H:%M:%S", time.gmtime()), 'structured')
+        modelVariables = pyMtsf.ModelVariables(variable, MtsfFmi2.StandardSeriesForFmi, pyMtsf.StandardCategoryNames)
+        modelVariables.allSeries[0].initialRows = 1  # Fixed
+        modelVariables.allSeries[2].initialRows = 10  # Discrete
+        modelVariables.allSeries[1].initialRows = max(1 + int((stopTime - startTime) / stepSize), 10)  # Continuous
+        experimentSetup = pyMtsf.ExperimentSetup(startTime=startTime, stopTime=stopTime,
+                                                 algorithm="Connected FMUs for CoSimulation", relativeTolerance='',
+                                                 author=getpass.getuser(), description="",
+                                                 generationDateAndTime=time.strftime("%a, %d %b %Y %H:%M:%S", time.gmtime()),
+                                                 generationTool="PySimulator", machine=os.getenv('COMPUTERNAME'),
+                                                 cpuTime="")
+        results = Mtsf.Results(resultFileName, modelDescription, modelVariables, experimentSetup, allSimpleTypes, allUnits, allEnumerations)
+        if not results.isAvailable:
+            raise FMUError("Result file " + resultFileName + " cannot be opened for write access.\n")
+
+        try:
+            return results, self._bindResultRows(results, modelVariables, origin)
+        except:
+            # The file is not used if the rows cannot be bound
+            results.close()
+            raise
+
+    def _bindResultRows(self, results, modelVariables, origin):
+        ''' Returns a dictionary with the list of ResultRow of each time series of results;
+            origin maps the names of the variables to (interface, valueReference)
+        '''
+        # Columns of each category per FMU
+        rows = dict()
+        columns = collections.OrderedDict()
+        for series in results._mtsf.results.series.values():
+            for category in series.category.values():
+                rows[category] = ResultRow(category, category.nColumn)
+        for name, scalar in modelVariables.variable.items():
+            if scalar.aliasName is None:
+                row = rows[scalar.category]
+                if name in origin:
+                    interface, valueReference = origin[name]
+                    key = (row, interface)
+                    if key not in columns:
+                        columns[key] = ([], [])
+                    columns[key][0].append(scalar.columnIndex)
+                    columns[key][1].append(valueReference)
+                else:
+                    # Time variables, that do not exist in the FMUs
+                    row.timeColumn = scalar.columnIndex
+        for (row, interface), (columnIndices, valueReferences) in columns.items():
+            dataType = pyMtsf.CategoryReverseMapping[row.category.name]
+            row.parts.append((numpy.array(columnIndices), interface.bindGather(numpy.array(valueReferences, dtype=numpy.uint32), dataType)))
+
+        seriesRows = dict()
+        for seriesName, series in results._mtsf.results.series.items():
+            seriesRows[seriesName] = [rows[category] for category in series.category.values()]
+        return seriesRows
+
+    def simulate(self, startTime=None, stopTime=None, stepSize=None, resultFileName=None, nThreads=None):
+        ''' Simulates the connected FMUs from startTime to stopTime with communication step size stepSize
+            and returns the name of the result file; default values are taken from the connection description
+        '''
+        startTime = self.startTime if startTime is None else startTime
+        stopTime = self.stopTime if stopTime is None else stopTime
+        stepSize = self.stepSize if stepSize is None else stepSize
+        resultFileName = self.resultFileName if resultFileName is None else resultFileName
+        interfaces = self.instances.values()
+
+        def writeResults(seriesName, t):
+            if seriesName not in seriesRows:
+                # e.g. no parameters
+                return
+            for row in seriesRows[seriesName]:
+                row.category.writeData(row.get(t))
+
+        def doStep(interface):
+            return interface.fmiDoStep(t, dt, fmiTrue)
+
+        def terminatedAt(interface):
+            ''' Returns the last successful time if interface terminated the simulation, otherwise None
+            '''
+            status, info = interface.fmiGetBooleanStatus(3)  # fmi2Terminated
+            if info == fmiTrue:
+                status, lastTime = interface.fmiGetRealStatus(2)  # fmi2LastSuccessfulTime
+                return lastTime
+            return None
+
+        results, seriesRows = self._prepareResultFile(resultFileName, startTime, stopTime, stepSize)
+        pool = ThreadPool(nThreads or len(interfaces))
+        cpuStart = time.clock()
+        try:
+            # Initialization; the inputs are set from the outputs of the initialization mode
+            for interface in interfaces:
+                interface.fmiInstantiate()
+                status = interface.fmiSetupExperiment(fmiFalse, 0.0, startTime, fmiTrue, stopTime)
+                status = max(status, interface.fmiEnterInitializationMode())
+                if status > 1:
+                    raise FMUError('Initialization of the connected FMUs failed.\n')
+            status = self.exchangeValues()
+            for interface in interfaces:
+                status = max(status, interface.fmiExitInitializationMode())
+            status = max(status, self.exchangeValues())
+            if status > 1:
+                raise FMUError('Initialization of the connected FMUs failed.\n')
+
+            t = startTime
+            writeResults('Fixed', t)
+            writeResults('Continuous', t)
+            writeResults('Discrete', t)
+            k = 0
+            while t < stopTime:
+                if self.stopRequest:
+                    print("Simulation of connected FMUs stopped at time = {:.2e}".format(t))
+                    break
+                k += 1
+                dt = min(startTime + k * stepSize, stopTime) - t
+                status = pool.map(doStep, interfaces)
+                if max(status) > 2:
+                    raise FMUError("Error in doStep at time = {:.2e}\n".format(t))
+                if max(status) == 2:  # Discard
+                    lastTimes = [terminatedAt(interface) for interface, s in zip(interfaces, status) if s == 2]
+                    if None in lastTimes:
+                        raise FMUError("Not supported status in doStep at time = {:.2e}\n".format(t))
+                    # Terminated by an FMU
+                    t = min(lastTimes)
+                    writeResults('Continuous', t)
+                    writeResults('Discrete', t)
+                    break
+                t = t + dt
+                if self.exchangeValues() > 1:
+                    raise FMUError("Error when exchanging values at time = {:.2e}\n".format(t))
+                writeResults('Continuous', t)
+                writeResults('Discrete', t)
+            print("Simulation of connected FMUs finished at time = {:.2e} after {:.2f} s CPU time".format(t, time.clock() - cpuStart))
+        finally:
+            pool.close()
+            pool.join()
+            for interface in interfaces:
+                if getattr(interface, '_fmiComponent', None) is not None:
+                    interface.fmiTerminate()
+                    interface.freeModelInstance()
+                    interface._fmiComponent = None
+            results.close()
+        return resultFileName
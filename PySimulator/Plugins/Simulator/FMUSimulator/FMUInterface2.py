@@ -117,6 +117,124 @@ class _fmiCallbackFunctions(ctypes.Structure):
 
 
 
+class BoundGather:
+    ''' fmi2GetReal, fmi2GetInteger or fmi2GetBoolean for a fixed vector of value references.
+        The output vector and the ctypes arguments are created once,
+        so that get() does not allocate. Note that get() always returns the same
+        vector, i.e. the values have to be copied before the next call.
+    '''
+    def __init__(self, interface, function, valueReference, value, vectorType):
+        self._interface = interface
+        self._function = function
+        self.valueReference = numpy.ascontiguousarray(valueReference, numpy.uint32)
+        self.value = value
+        self._valueReference = self.valueReference.ctypes.data_as(fmiValueReferenceVector)
+        self._length = ctypes.c_size_t(len(self.valueReference))
+        self._value = self.value.ctypes.data_as(vectorType)
+
+    def get(self):
+        ''' Returns status and the vector of values
+        '''
+        status = self._function(self._interface._fmiComponent, self._valueReference, self._length, self._value)
+        return status, self.value
+
+
+
+class BoundRightHandSide:
+    ''' Right hand side of a Model Exchange FMU as one callable: fmi2SetTime,
+        fmi2SetContinuousStates and fmi2GetDerivatives with preallocated state and
+        derivative vectors and ctypes arguments created once.
+        A call returns the derivative vector itself (not a copy), i.e. it is
+        overwritten by the next call.
+        Time and states set last are remembered, so that setting the same values
+        again (e.g. for event indicators at the point the rhs was just evaluated)
+        is skipped. Call invalidate() when the model may have changed them otherwise.
+    '''
+    def __init__(self, interface):
+        self._interface = interface
+        self._setTime = interface._fmiSetTime
+        self._setContinuousStates = interface._fmiSetContinuousStates
+        self._getDerivatives = interface._fmiGetDerivatives
+        self.nx = interface.description.numberOfContinuousStates
+        self._length = ctypes.c_size_t(self.nx)
+        self.x = numpy.zeros(self.nx)
+        # A model without states has the dummy derivative 0.0
+        self.dx = numpy.zeros(max(self.nx, 1))
+        self._x = self.x.ctypes.data_as(fmiRealVector)
+        self._dx = self.dx.ctypes.data_as(fmiRealVector)
+        self.invalidate()
+
+    def invalidate(self):
+        ''' Forgets the time and states set last
+        '''
+        self.t = None
+        self._statesSet = False
+
+    def setTimeAndStates(self, t, x):
+        ''' Sets time and states in the model unless they equal the values set last
+        '''
+        component = self._interface._fmiComponent
+        if t != self.t:
+            self._setTime(component, t)
+            self.t = t
+        if self.nx > 0 and (not self._statesSet or not numpy.array_equal(x, self.x)):
+            self.x[:] = x
+            self._setContinuousStates(component, self._x, self._length)
+            self._statesSet = True
+
+    def __call__(self, t, x):
+        self.setTimeAndStates(t, x)
+        if self.nx > 0:
+            self._getDerivatives(self._interface._fmiComponent, self._dx, self._length)
+        return self.dx
+
+
+
+class BoundDirectionalDerivative:
+    ''' fmi2GetDirectionalDerivative for fixed vectors of unknown and known value
+        references (e.g. derivatives and states) with preallocated seed and result vectors.
+    '''
+    def __init__(self, interface, vUnknown_ref, vKnown_ref):
+        self._interface = interface
+        self._function = interface._fmiGetDirectionalDerivative
+        self.vUnknown_ref = numpy.ascontiguousarray(vUnknown_ref, numpy.uint32)
+        self.vKnown_ref = numpy.ascontiguousarray(vKnown_ref, numpy.uint32)
+        self.dvKnown = numpy.zeros(len(self.vKnown_ref))
+        self.dvUnknown = numpy.zeros(len(self.vUnknown_ref))
+        self._vUnknown_ref = self.vUnknown_ref.ctypes.data_as(fmiValueReferenceVector)
+        self._nUnknown = ctypes.c_size_t(len(self.vUnknown_ref))
+        self._vKnown_ref = self.vKnown_ref.ctypes.data_as(fmiValueReferenceVector)
+        self._nKnown = ctypes.c_size_t(len(self.vKnown_ref))
+        self._dvKnown = self.dvKnown.ctypes.data_as(fmiRealVector)
+        self._dvUnknown = self.dvUnknown.ctypes.data_as(fmiRealVector)
+
+    def _call(self):
+        return self._function(self._interface._fmiComponent, self._vUnknown_ref, self._nUnknown,
+                              self._vKnown_ref, self._nKnown, self._dvKnown, self._dvUnknown)
+
+    def get(self, dvKnown):
+        ''' Returns status and the directional derivative of the unknowns for the seed vector dvKnown;
+            the returned vector is overwritten by the next call
+        '''
+        self.dvKnown[:] = dvKnown
+        return self._call(), self.dvUnknown
+
+    def jacobian(self):
+        ''' Returns status and the dense matrix d(unknowns)/d(knowns),
+            computed column by column with unit seed vectors
+        '''
+        J = numpy.empty((len(self.vUnknown_ref), len(self.vKnown_ref)))
+        status = 0
+        self.dvKnown[:] = 0.0
+        for j in xrange(len(self.vKnown_ref)):
+            self.dvKnown[j] = 1.0
+            status = max(status, self._call())
+            self.dvKnown[j] = 0.0
+            J[:, j] = self.dvUnknown
+        return status, J
+
+
+
 class FMUInterface:
     ''' This class encapsulates the FMU C-Interface
         all fmi* functions are a public interface to the FMU-functions        
@@ -476,6 +594,28 @@ class FMUInterface:
         status = self._fmiGetBoolean(self._fmiComponent, valueReference.ctypes.data_as(fmiValueReferenceVector), len(valueReference), value.ctypes.data_as(fmiBooleanVector))
         return status, value
 
+    def bindGather(self, valueReference, dataType='Real'):
+        ''' Returns a BoundGather object to repeatedly get the values of valueReference;
+            dataType is 'Real', 'Integer' or 'Boolean'
+        '''
+        if dataType == 'Real':
+            return BoundGather(self, self._fmiGetReal, valueReference, createfmiRealVector(len(valueReference)), fmiRealVector)
+        elif dataType == 'Integer':
+            return BoundGather(self, self._fmiGetInteger, valueReference, createfmiIntegerVector(len(valueReference)), fmiIntegerVector)
+        elif dataType == 'Boolean':
+            return BoundGather(self, self._fmiGetBoolean, valueReference, createfmiBooleanVector(len(valueReference)), fmiBooleanVector)
+        raise ValueError('Values of type ' + str(dataType) + ' cannot be gathered by bindGather')
+
+    def bindRightHandSide(self):
+        ''' Returns a BoundRightHandSide object computing the derivatives for given time and states
+        '''
+        return BoundRightHandSide(self)
+
+    def bindDirectionalDerivative(self, vUnknown_ref, vKnown_ref):
+        ''' Returns a BoundDirectionalDerivative object for the unknowns vUnknown_ref with respect to the knowns vKnown_ref
+        '''
+        return BoundDirectionalDerivative(self, vUnknown_ref, vKnown_ref)
+
     def fmiGetString(self, valueReference):
         value = createfmiStringVector(len(valueReference))
         status = self._fmiGetString(self._fmiComponent, valueReference.ctypes.data_as(fmiValueReferenceVector), len(valueReference), value)
@@ -501,8 +641,12 @@ class FMUInterface:
             raise IndexError('length of valueReference not corresponding to length of value')
         return self._fmiSetString(self._fmiComponent, valueReference.ctypes.data_as(fmiValueReferenceVector), len(valueReference), value.ctypes.data_as(fmiStringVector))
 
-    def fmiGetFMUstate(self):              
-        FMUstate = ctypes.c_void_p()        
+    def fmiGetFMUstate(self, FMUstate=None):
+        ''' Returns status and the FMU state; if FMUstate is given (an fmiFMUstate returned
+            before), the state is stored in it without allocating a new one
+        '''
+        if FMUstate is None:
+            FMUstate = ctypes.c_void_p()
         status = self._fmiGetFMUstate(self._fmiComponent, ctypes.byref(FMUstate))        
         return status, FMUstate
  
@@ -533,7 +677,7 @@ class FMUInterface:
     def fmiGetDirectionalDerivative(self, vUnknown_ref, vKnown_ref, dvKnown):
         dvUnknown = createfmiRealVector(len(vUnknown_ref))
         status = self._fmiGetDirectionalDerivative(self._fmiComponent, vUnknown_ref.ctypes.data_as(fmiValueReferenceVector), len(vUnknown_ref), 
-                                                   vKnown_ref.ctypes.data_as(fmiValueReferenceVector), len(vKnown_ref), dvKnown.ctypes.data_as(fmiRealVector), dvUnknown)
+                                                   vKnown_ref.ctypes.data_as(fmiValueReferenceVector), len(vKnown_ref), dvKnown.ctypes.data_as(fmiRealVector), dvUnknown.ctypes.data_as(fmiRealVector))
         return status, dvUnknown
     
     def fmiEnterEventMode(self):
@@ -632,12 +776,42 @@ class FMUInterface:
 
 
 
+def _benchmarkRightHandSide(fmu, nCalls=100000):
+    ''' Prints the calls per second of the right hand side by the single
+        fmi-functions (as formerly done by FMUSimulator2.getDerivatives) and by BoundRightHandSide
+    '''
+    import time
+    fmu.fmiNewDiscreteStates()
+    fmu.fmiEnterContinuousTimeMode()
+    status, x = fmu.fmiGetContinuousStates()
+
+    startTime = time.time()
+    for i in xrange(nCalls):
+        fmu.fmiSetTime(0.0)
+        fmu.fmiSetContinuousStates(x)
+        status, dx = fmu.fmiGetDerivatives()
+        dx = numpy.array([dx])[0]
+    separateCalls = nCalls / (time.time() - startTime)
+
+    rhs = fmu.bindRightHandSide()
+    startTime = time.time()
+    for i in xrange(nCalls):
+        # Measure the complete call (a solver changes time and states at every call)
+        rhs.invalidate()
+        dx = rhs(0.0, x)
+    boundCalls = nCalls / (time.time() - startTime)
+    print "Right hand side calls/s: separate fmi-functions %.0f, BoundRightHandSide %.0f (factor %.2f)" % (separateCalls, boundCalls, boundCalls / separateCalls)
+
+
+
 if __name__ == '__main__':
     fmu = FMUInterface('d:/Rectifier.fmu')
     fmu.fmiInstantiate()
     fmu.fmiSetupExperiment(fmiTrue, 1e-6, 0.0, fmiTrue, 1.0)
     fmu.fmiEnterInitializationMode()
     fmu.fmiExitInitializationMode()   
+    if fmu.activeFmiType == 'me' and fmu.description.numberOfContinuousStates > 0:
+        _benchmarkRightHandSide(fmu)
     status, state = fmu.fmiGetFMUstate()
     print status, state
     
@@ -353,8 +353,10 @@ class Model(SimulatorBase.Model):
             modelVariables.allSeries[1].initialRows = max(nGridPoints, modelVariables.allSeries[2].initialRows)  # Continuous
 
             # Create result object
+            layout = pyMtsf.DatasetLayout(settings.resultFileCompression, settings.resultFileCompressionLevel,
+                                          settings.resultFileChunkColumns, settings.resultFileChunkBytes)
             mtsf = Mtsf.Results(settings.resultFileName,
-                               modelDescription, modelVariables, experimentSetup, simpleTypes, units, enumerations)
+                               modelDescription, modelVariables, experimentSetup, simpleTypes, units, enumerations, layout)
             if not mtsf.isAvailable:
                 print("Result file " + settings.resultFileName + " cannot be opened for write access.\n")
                 self.integrationResults = IntegrationResults.Results()
@@ -484,6 +486,7 @@ class Model(SimulatorBase.Model):
             if solver is not None and 'Discrete' in self.integrationResults._mtsf.results.series:
                 # Write discrete Variables
                 writeResults('Discrete', solver.t)
+            self.integrationStatistics.nResultFileResizes = self.integrationResults._mtsf.results.resizeCount()
             # Terminate simulation in model
             self.interface.fmiTerminate()
             self.interface.freeModelInstance()
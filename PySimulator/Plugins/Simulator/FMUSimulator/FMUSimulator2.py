@@ -54,6 +54,14 @@ from ...Simulator.FMUSimulator.FMUInterface2 import fmiTrue, fmiFalse
 from ...Simulator import SimulatorBase
 
 
+# Integration algorithms with fixed step size: name -> (method of FixedStepSolver, dense output)
+fixedStepAlgorithmNames = ["Explicit Euler (fixed step size)", "Heun (fixed step size)",
+                           "Runge-Kutta 4 (fixed step size)", "Runge-Kutta 4 with dense output (fixed step size)"]
+fixedStepAlgorithms = dict(zip(fixedStepAlgorithmNames, [('Euler', False), ('Heun', False), ('RK4', False), ('RK4', True)]))
+# Co-Simulation by AdaptiveCommunicationStep (if the FMU can get and set its state and handle variable step sizes)
+adaptiveCoSimulationAlgorithm = "Adaptive communication step size (FMU for CoSimulation)"
+
+
 
 class Model(SimulatorBase.Model):
     ''' Class to describe a whole "model", including all FMU information
@@ -101,10 +109,10 @@ class Model(SimulatorBase.Model):
             self.integrationSettings.resultFileExtension = 'mtsf'
             # Default values
             updateSettingsByFMI(self.description)
-            self._availableIntegrationAlgorithms = ["BDF (IDA, Dassl like)", "BDF (CVode)", "Adams (CVode)", "Explicit Euler (fixed step size)"]
-            self._IntegrationAlgorithmHasFixedStepSize = [False, False, False, True]
-            self._IntegrationAlgorithmCanProvideStepSizeResults = [True, True, True, True]
-            self._IntegrationAlgorithmSupportsStateEvents = [True, True, True, True]
+            self._availableIntegrationAlgorithms = ["BDF (IDA, Dassl like)", "BDF (CVode)", "Adams (CVode)"] + fixedStepAlgorithmNames
+            self._IntegrationAlgorithmHasFixedStepSize = [False, False, False] + [True] * len(fixedStepAlgorithmNames)
+            self._IntegrationAlgorithmCanProvideStepSizeResults = [True, True, True] + [True] * len(fixedStepAlgorithmNames)
+            self._IntegrationAlgorithmSupportsStateEvents = [True, True, True] + [True] * len(fixedStepAlgorithmNames)
     
             self.integrationSettings.algorithmName = self._availableIntegrationAlgorithms[0]
             self.simulationStopRequest = False
@@ -119,6 +127,11 @@ class Model(SimulatorBase.Model):
             self._IntegrationAlgorithmHasFixedStepSize = [False]
             self._IntegrationAlgorithmCanProvideStepSizeResults = [False]
             self._IntegrationAlgorithmSupportsStateEvents = [False]
+            if self.description.cs.canGetAndSetFMUstate == 'true' and self.description.cs.canHandleVariableCommunicationStepSize == 'true':
+                self._availableIntegrationAlgorithms.append(adaptiveCoSimulationAlgorithm)
+                self._IntegrationAlgorithmHasFixedStepSize.append(False)
+                self._IntegrationAlgorithmCanProvideStepSizeResults.append(True)
+                self._IntegrationAlgorithmSupportsStateEvents.append(False)
     
             self.integrationSettings.algorithmName = self._availableIntegrationAlgorithms[0]
             self.simulationStopRequest = False
@@ -180,6 +193,19 @@ class Model(SimulatorBase.Model):
     def simulate(self):
         ''' The main simulation function
         '''
+        self._resultWriter = None
+        try:
+            self._simulate()
+        finally:
+            # Join the writer thread also if the simulation stopped by an exception
+            if self._resultWriter is not None:
+                self._resultWriter.close()
+                self._resultWriter = None
+
+    def _simulate(self):
+        ''' Simulates the model; the result file is written by self._resultWriter
+            if a background writer is used
+        '''
 
         def prepareResultFile():
             # Prepare result file
@@ -204,8 +230,10 @@ class Model(SimulatorBase.Model):
             modelVariables.allSeries[1].initialRows = max(nGridPoints, modelVariables.allSeries[2].initialRows)  # Continuous
 
             # Create result object
+            layout = pyMtsf.DatasetLayout(settings.resultFileCompression, settings.resultFileCompressionLevel,
+                                          settings.resultFileChunkColumns, settings.resultFileChunkBytes)
             mtsf = Mtsf.Results(settings.resultFileName,
-                               modelDescription, modelVariables, experimentSetup, simpleTypes, units, enumerations)
+                               modelDescription, modelVariables, experimentSetup, simpleTypes, units, enumerations, layout)
             if not mtsf.isAvailable:
                 print("Result file " + settings.resultFileName + " cannot be opened for write access.\n")
                 self.integrationResults = IntegrationResults.Results()
@@ -252,6 +280,15 @@ class Model(SimulatorBase.Model):
                         category.references = numpy.array([])
                 else:
                     series.independentVariableCategory = None
+
+            # Bind the reference vectors, so that getting the values at an output point does not allocate
+            for series in mtsf._mtsf.results.series.values():
+                for category in series.category.values():
+                    dataType = pyMtsf.CategoryReverseMapping[category.name]
+                    if category.references.shape[0] > 0 and dataType != 'String':
+                        category.gather = self.interface.bindGather(category.references, dataType)
+                    else:
+                        category.gather = None
             self.integrationResults = mtsf
             return True
 
@@ -259,11 +296,13 @@ class Model(SimulatorBase.Model):
             ''' Writes variable values at time 'time' to result file.
                 Only variables of the given series are written.
             '''
-            if hasattr(self, 'integrationResultFileSemaphore'):
+            if writer is None and hasattr(self, 'integrationResultFileSemaphore'):
                 self.integrationResultFileSemaphore.acquire()
             series = self.integrationResults._mtsf.results.series[seriesName]
             for category in series.category.values():
-                if category.references.shape[0] > 0:
+                if category.gather is not None:
+                    status, values = category.gather.get()
+                elif category.references.shape[0] > 0:
                     status, values = category.fmiGetValues(category.references)
                 else:
                     values = numpy.ndarray((1,))
@@ -271,24 +310,29 @@ class Model(SimulatorBase.Model):
                     # There is a time
                     index = category.independentVariableColumn
                     values[index] = time
-                category.writeData(values)
-            if hasattr(self, 'integrationResultFileSemaphore'):
+                if writer is None:
+                    category.writeData(values)
+                else:
+                    # The values are copied, the file is written by the writer thread
+                    writer.append(category, values)
+            if writer is None and hasattr(self, 'integrationResultFileSemaphore'):
                 self.integrationResultFileSemaphore.release()
 
         def right_hand_side(t, x, xd=None):
             ''' Returns the right hand side (or the delta to xd for implicit solvers)
             '''
-            dx = self.getDerivatives(t, x)  # dx is returned as matrix with one row [[ 0.1  0.4]]
+            dx = rhs(t, x)  # dx is the vector of rhs, overwritten by the next call
             if implicitSolver:
-                return dx[0] - xd  # numpy.array(dx - xd)#maybe [dx] #dx - xd
+                return dx - xd
             else:
-                return dx[0]  # return dx as vector
+                return dx
 
         def state_events(t, x, sw):
             ''' Returns event indicator functions at time=t, states=x
             '''
-            test = self.getEventIndicators(t, x)
-            return numpy.array(test)
+            rhs.setTimeAndStates(t, x)
+            status, z = self.interface.fmiGetEventIndicators()
+            return z
 
         def state_eventsImplicit(t, x, xd, sw):
             ''' Returns event indicator functions at time=t, states=x
@@ -323,9 +367,7 @@ class Model(SimulatorBase.Model):
 
             # Write results
             if self.interface.activeFmiType == 'me':
-                self.interface.fmiSetTime(t)
-                if not self.description.numberOfContinuousStates == 0:
-                    self.interface.fmiSetContinuousStates(x)
+                rhs.setTimeAndStates(t, x)
 
             writeResults('Continuous', t)
             self.integrationStatistics.nGridPoints += 1
@@ -337,11 +379,18 @@ class Model(SimulatorBase.Model):
             if solver is not None and 'Discrete' in self.integrationResults._mtsf.results.series:
                 # Write discrete Variables
                 writeResults('Discrete', solver.t)
+            if writer is not None:
+                # Wait until all results are written
+                writer.close()
+            self.integrationStatistics.nResultFileResizes = self.integrationResults._mtsf.results.resizeCount()
         
             # Terminate simulation in model
             self.interface.fmiTerminate()
             self.interface.freeModelInstance()
 
+        # True, if fmiCompletedIntegratorStep requested a step event at the last completed step
+        stepEventRequested = [False]
+
         def handle_event(solver, event_info=None):
             ''' There is an event. Do the re-initialization and prepare
                 the simulation to be proceeded.
@@ -351,18 +400,21 @@ class Model(SimulatorBase.Model):
                         False, if simulation shall be terminated
             '''
 
+            stepEvent = stepEventRequested[0]
+            stepEventRequested[0] = False
             if event_info[1]:
                 self.integrationStatistics.nTimeEvents += 1
                 # print "Handle time event at   ", solver.t_cur
+            elif stepEvent and not numpy.any(event_info[0]):
+                # Only a step event, that is not counted
+                pass
             else:
                 self.integrationStatistics.nStateEvents += 1
 
                 # print "Handle state event at  ", solver.t_cur
 
             # To ensure that the current values are set in the model
-            self.interface.fmiSetTime(solver.t)
-            if not self.description.numberOfContinuousStates == 0:
-                self.interface.fmiSetContinuousStates(solver.y)
+            rhs.setTimeAndStates(solver.t, solver.y)
           
             # handle_result(solver, solver.t, solver.y) here if your solver does not call it by itself(Assimulo does)
 
@@ -376,6 +428,8 @@ class Model(SimulatorBase.Model):
             
             s1 = self.interface.fmiEnterContinuousTimeMode()
             s2 = 0             
+            # The event iteration may have changed the states in the model
+            rhs.invalidate()
             
             if eventInfo.nextEventTimeDefined == fmiTrue:
                 simulator.nextTimeEvent = eventInfo.nextEventTime
@@ -413,22 +467,63 @@ class Model(SimulatorBase.Model):
 
 
 
+        def jacobian(t, x, sw=None):
+            ''' Returns the Jacobian d(rhs)/dx at time=t, states=x
+                computed by directional derivatives of the model
+            '''
+            rhs.setTimeAndStates(t, x)
+            if coloring is None:
+                status, J = directionalDerivative.jacobian()
+            else:
+                status, J = coloring.directionalDerivativeJacobian(directionalDerivative)
+            if status > 1:
+                print("error in fmiGetDirectionalDerivative at time = {:.2e}".format(t))
+                # Raise exception to abort simulation...
+                finalize(None)
+                raise(SimulatorBase.Stopping)
+            return J
+
+        def jacobianDifferenceQuotient(t, x, sw=None):
+            ''' Returns the Jacobian d(rhs)/dx at time=t, states=x
+                computed by difference quotients of the columns of one color
+            '''
+            dx0 = rhs(t, x).copy()
+            return coloring.differenceQuotientJacobian(lambda xPerturbed: rhs(t, xPerturbed), x, dx0)
+
+        def jacobianImplicit(c, t, x, xd, sw=None):
+            ''' Returns d(res)/dx + c*d(res)/dxd for the residual res = rhs(t, x) - xd
+            '''
+            J = stateJacobian(t, x)
+            J[numpy.diag_indices_from(J)] -= c
+            return J
+
         def completed_step(solver):
             ''' Function that is called after each successful integrator step
                 Returns True,  if there was a step event
                         False, if there was no step event
             '''
-            return False  # to be done for FMI2.0
-            '''
-            if self.interface.fmiCompletedIntegratorStep() == fmiTrue:
-                solver.handle_event(solver)
-                return True
-            else:
-                return False
-            '''
+            rhs.setTimeAndStates(solver.t, solver.y)
+            # The solver never resets the model to a time before the completed step
+            status, enterEventMode, terminateSimulation = self.interface.fmiCompletedIntegratorStep(True)
+            if status > 1:
+                print("error in fmiCompletedIntegratorStep at time = {:.2e}".format(solver.t))
+                # Raise exception to abort simulation...
+                finalize(solver)
+                raise(SimulatorBase.Stopping)
+            if terminateSimulation:
+                handle_result(solver, solver.t, solver.y)
+                if 'Discrete' in self.integrationResults._mtsf.results.series:
+                    # Write discrete Variables
+                    writeResults('Discrete', solver.t)
+                print("terminated by model ... ")
+                # Raise exception to abort simulation...
+                finalize(solver)
+                raise(SimulatorBase.Stopping)
+            stepEventRequested[0] = enterEventMode
+            return enterEventMode
         
-        def doStep(t, dt):
-            status = self.interface.fmiDoStep(t, dt, fmiTrue)            
+        def doStep(t, dt, noSetFMUStatePriorToCurrentPoint=fmiTrue):
+            status = self.interface.fmiDoStep(t, dt, noSetFMUStatePriorToCurrentPoint)
             if status > 2:
                 print("error in doStep at time = {:.2e}".format(t))
                 # Raise exception to abort simulation...
@@ -446,6 +541,12 @@ class Model(SimulatorBase.Model):
         # Initialize result file
         if not prepareResultFile():
             return
+        if self.integrationSettings.resultFileBackgroundWriter:
+            categories = [category for series in self.integrationResults._mtsf.results.series.values() for category in series.category.values()]
+            writer = pyMtsf.BackgroundWriter(categories, getattr(self, 'integrationResultFileSemaphore', None))
+        else:
+            writer = None
+        self._resultWriter = writer
 
         # Set Simulation options
         Tstart = self.integrationSettings.startTime
@@ -483,6 +584,10 @@ class Model(SimulatorBase.Model):
         if 'Fixed' in self.integrationResults._mtsf.results.series:
             # Write parameter values
             writeResults('Fixed', Tstart)
+
+        if self.interface.activeFmiType == 'me':
+            # Fused fmiSetTime, fmiSetContinuousStates and fmiGetDerivatives
+            rhs = self.interface.bindRightHandSide()
             
                     
         if self.interface.activeFmiType == 'me':
@@ -517,8 +622,8 @@ class Model(SimulatorBase.Model):
                 simulator.iter = 'Newton'  # Default 'FixedPoint'
                 simulator.discr = IntegrationMethod  # Default 'Adams'
             else:
-                simulator = ExplicitEulerSolver()
-                simulator.completed_step = completed_step
+                method, denseOutput = fixedStepAlgorithms[IntegrationMethod]
+                simulator = FixedStepSolver(method, denseOutput)
     
             # Set starting parameters common to all integrators here:
             simulator.t0 = Tstart
@@ -531,7 +636,26 @@ class Model(SimulatorBase.Model):
             simulator.handle_result = handle_result
             simulator.handle_event = handle_event
             simulator.finalize = finalize  # should not be called by the solver (needs one argument then) simulator.finalize = finalize
-            # simulator.completed_step = completed_step  # is not supported by python-sundials
+            if not IntegrationMethod in fixedStepAlgorithms:
+                stateJacobian = None
+                pattern = self._getStateJacobianPattern()
+                coloring = JacobianColoring(pattern) if pattern is not None else None
+                if coloring is not None and coloring.nColors == pattern.shape[1]:
+                    # No compression possible
+                    coloring = None
+                if self._providesStateJacobian():
+                    # Analytic Jacobian instead of difference quotients
+                    stateReferences, derivativeReferences = self._getStateDerivativeReferences()
+                    directionalDerivative = self.interface.bindDirectionalDerivative(derivativeReferences, stateReferences)
+                    stateJacobian = jacobian
+                elif coloring is not None:
+                    # Difference quotients with one rhs call per color instead of per state
+                    stateJacobian = jacobianDifferenceQuotient
+                if stateJacobian is not None:
+                    simulator.jac = jacobianImplicit if implicitSolver else stateJacobian
+            if self.description.me.completedIntegratorStepNotNeeded != 'true':
+                # Step events (called by Assimulo as step_events)
+                simulator.completed_step = completed_step
     
             # These methods can not have xd=None due to its signature... Apply its dummy-Versions here
             if implicitSolver == True:
@@ -552,14 +676,67 @@ class Model(SimulatorBase.Model):
                 print("Start integration of " + self.description.modelName + " ... ")
     
             # Simulate until end of integration interval
-            if "Euler" in IntegrationMethod:
+            if IntegrationMethod in fixedStepAlgorithms:
                 if nIntervals == None:
-                    nIntervals = (Tend - Tstart) / gridWidth - 1
+                    nIntervals = (Tend - Tstart) / gridWidth
                 simulator.simulate(Tstart, self.integrationSettings.fixedStepSize, Tend, x0, nIntervals, gridWidth)
             else:
                 simulator.simulate(Tend, nIntervals, gridWidth)
                 
         
+        elif self.interface.activeFmiType == 'cs' and IntegrationMethod == adaptiveCoSimulationAlgorithm:
+            # Do Co-Simulation for one single FMU with adaptive communication step size;
+            # results are written on the output grid as for the fixed communication step size
+
+            if gridWidth is None:
+                gridWidth = (Tend - Tstart) / max(nIntervals, 1)
+
+            # Step size control by the Real outputs (or all continuous Real variables, if there are no outputs)
+            references = [int(x.valueReference) for x in self.description.scalarVariables.values() if x.causality == 'output' and x.type.basicType == 'Real']
+            if len(references) == 0:
+                category = self.integrationResults._mtsf.results.series['Continuous'].category.get(pyMtsf.CategoryMapping['Real'])
+                if category is not None:
+                    references = category.references
+            outputs = self.interface.bindGather(numpy.array(references, dtype=numpy.uint32))
+            fmuState = FMUInterface.fmiFMUstate()
+
+            def terminatedAt():
+                status, info = self.interface.fmiGetBooleanStatus(3)  # fmi2Terminated
+                if info == fmiTrue:
+                    status, lastTime = self.interface.fmiGetRealStatus(2)  # fmi2LastSuccessfulTime
+                    return lastTime
+                return None
+
+            def writeCommunicationPoint(t):
+                handle_result(None, t)
+                if 'Discrete' in self.integrationResults._mtsf.results.series:
+                    # Write discrete Variables
+                    writeResults('Discrete', t)
+
+            master = AdaptiveCommunicationStep()
+            master.rtol = ErrorTolerance
+            master.atol = ErrorTolerance
+            master.hMin = gridWidth * 1e-6
+            master.hMax = gridWidth
+            master.doStep = lambda t, dt: doStep(t, dt, fmiFalse)
+            master.getOutputs = lambda: outputs.get()[1]
+            master.saveState = lambda: self.interface.fmiGetFMUstate(fmuState)
+            master.restoreState = lambda: self.interface.fmiSetFMUstate(fmuState)
+            master.terminatedAt = terminatedAt
+            master.handle_result = writeCommunicationPoint
+            try:
+                success = master.simulate(Tstart, Tend, gridWidth, gridWidth)
+            finally:
+                if fmuState.value is not None:
+                    self.interface.fmiFreeFMUstate(fmuState)
+            if not success:
+                print("Step discarded by the FMU at minimum step size at time = {:.2e}".format(self.integrationStatistics.reachedTime))
+                # Raise exception to abort simulation...
+                finalize()
+                raise(SimulatorBase.Stopping)
+            print("Communication steps: {:d} accepted, {:d} rejected".format(master.nAccepted, master.nRejected))
+            finalize()
+
         elif self.interface.activeFmiType == 'cs':
             # Do Co-Simulation for one single (self-containing) FMU
             
@@ -779,6 +956,50 @@ class Model(SimulatorBase.Model):
         
         return x
 
+    def _getStateDerivativeReferences(self):
+        ''' Returns the value references of the states and of the state derivatives
+            in the order of the state vector (given by ModelStructure/Derivatives)
+        '''
+        variables = self.description.scalarVariables.values()
+        derivatives = [variables[int(x.index) - 1] for x in self.description.modelStructure.derivatives]
+        states = [variables[int(x.type.derivative) - 1] for x in derivatives]
+        stateReferences = numpy.array([int(x.valueReference) for x in states], numpy.uint32)
+        derivativeReferences = numpy.array([int(x.valueReference) for x in derivatives], numpy.uint32)
+        return stateReferences, derivativeReferences
+
+    def _getStateJacobianPattern(self):
+        ''' Returns the sparsity pattern of d(der(x))/dx as boolean matrix given by the
+            dependencies in ModelStructure/Derivatives, or None if they are not available
+        '''
+        structure = self.description.modelStructure
+        n = self.description.numberOfContinuousStates
+        if structure is None or n == 0 or len(structure.derivatives) != n:
+            return None
+        variables = self.description.scalarVariables.values()
+        derivatives = [variables[int(x.index) - 1] for x in structure.derivatives]
+        # Index of the state variable -> column in the Jacobian
+        stateColumn = dict((int(x.type.derivative), j) for j, x in enumerate(derivatives))
+        pattern = numpy.zeros((n, n), dtype=bool)
+        for i, x in enumerate(structure.derivatives):
+            if x.dependencies is None:
+                # No dependencies given means dependent on all knowns
+                pattern[i, :] = True
+            else:
+                for index in x.dependencies.split():
+                    j = stateColumn.get(int(index))
+                    if j is not None:
+                        pattern[i, j] = True
+        return pattern
+
+    def _providesStateJacobian(self):
+        ''' Returns True if the Jacobian of the state derivatives can be computed by directional derivatives
+        '''
+        if self.description.me is None or self.description.me.providesDirectionalDerivative != 'true':
+            return False
+        if self.description.modelStructure is None or self.description.numberOfContinuousStates == 0:
+            return False
+        return len(self.description.modelStructure.derivatives) == self.description.numberOfContinuousStates
+
     def getStateNames(self):
         ''' Returns a list of Strings: the names of all states in the model.
         '''
@@ -959,38 +1180,289 @@ class Model(SimulatorBase.Model):
             self.variableTree.variable[vName] = SimulatorBase.TreeVariable(self.structureVariableName(vName), v.type.start, valueEdit, v.type.unit, v.variability, variableAttribute)
 
 
-class ExplicitEulerSolver():
+class JacobianColoring():
+    ''' Column coloring of a sparse Jacobian given by its boolean sparsity pattern:
+        columns of the same color have no nonzero row in common, so that all of them
+        are computed by one directional derivative or one difference quotient.
+    '''
+    def __init__(self, pattern):
+        self.shape = pattern.shape
+        nRows, nColumns = pattern.shape
+        # Greedy coloring, columns with most nonzeros first
+        rowsOfColumn = [numpy.nonzero(pattern[:, j])[0] for j in xrange(nColumns)]
+        order = sorted(xrange(nColumns), key=lambda j: -len(rowsOfColumn[j]))
+        self.colors = numpy.zeros(nColumns, dtype=int)
+        coveredRows = []
+        for j in order:
+            for color, covered in enumerate(coveredRows):
+                if not covered[rowsOfColumn[j]].any():
+                    break
+            else:
+                color = len(coveredRows)
+                coveredRows.append(numpy.zeros(nRows, dtype=bool))
+            coveredRows[color][rowsOfColumn[j]] = True
+            self.colors[j] = color
+        self.nColors = len(coveredRows)
+
+        # Seed vector and nonzero entries (rows, columns) of each color
+        rows, columns = numpy.nonzero(pattern)
+        self.seed = []
+        self.entries = []
+        for color in xrange(self.nColors):
+            self.seed.append((self.colors == color).astype(float))
+            inColor = self.colors[columns] == color
+            self.entries.append((rows[inColor], columns[inColor]))
+
+    def directionalDerivativeJacobian(self, directionalDerivative):
+        ''' Returns status and the Jacobian computed by one directional derivative
+            per color; directionalDerivative is a FMUInterface2.BoundDirectionalDerivative
+        '''
+        J = numpy.zeros(self.shape)
+        status = 0
+        for color in xrange(self.nColors):
+            s, dv = directionalDerivative.get(self.seed[color])
+            status = max(status, s)
+            rows, columns = self.entries[color]
+            J[rows, columns] = dv[rows]
+        return status, J
+
+    def differenceQuotientJacobian(self, f, x, f0):
+        ''' Returns the Jacobian of f at x computed by one forward difference quotient
+            per color; f0 = f(x)
+        '''
+        J = numpy.zeros(self.shape)
+        h = numpy.sqrt(numpy.finfo(float).eps) * numpy.maximum(numpy.abs(x), 1.0)
+        for color in xrange(self.nColors):
+            df = f(x + h * self.seed[color]) - f0
+            rows, columns = self.entries[color]
+            J[rows, columns] = df[rows] / h[columns]
+        return J
+
+
+
+class AdaptiveCommunicationStep():
     '''
-        Integration method: Explicit Euler with event handling (without rootfinding)
+        Co-Simulation of one FMU with adaptive communication step size: a step is rejected and
+        repeated with a smaller step size (after resetting the FMU to the state saved before the step)
+        if the FMU discards it or if the outputs deviate too much from their linear extrapolation;
+        the step size grows while the outputs are smooth.
+    '''
+    def __init__(self):
+        self.rtol = 1e-4  # Relative tolerance of the outputs
+        self.atol = 1e-4  # Absolute tolerance of the outputs
+        self.hMin = 0.0  # Steps of this size are accepted in any case
+        self.hMax = None  # Maximum step size (None: no limit)
+        self.safety = 0.9
+        self.maxGrowth = 2.0
+        self.maxReduction = 0.2
+        self.nAccepted = 0
+        self.nRejected = 0
+
+    # Functions that have to be set from outside:
+    #   doStep(t, h)        returns the fmiStatus of a communication step from t to t+h
+    #   getOutputs()        returns the vector of outputs
+    #   saveState()         saves the state of the FMU
+    #   restoreState()      resets the FMU to the saved state
+    #   terminatedAt()      returns the last successful time if the FMU terminated, otherwise None
+    #   handle_result(t)    writes the results at the output point t
+
+    def simulate(self, Tstart, Tend, h0, gridWidth):
+        ''' Simulates from Tstart to Tend starting with the step size h0;
+            the results are written at the output points Tstart + k*gridWidth (and Tend),
+            a step is shortened so that it does not cross the next output point.
+            Returns False if the FMU discards a step of the minimum step size
+        '''
+        t = Tstart
+        h = h0
+        y = numpy.array(self.getOutputs())
+        tPrevious = None
+        yPrevious = None
+        outputStepCounter = 1
+        nextOutputPoint = min(Tstart + gridWidth, Tend)
+        self.handle_result(t)
+        while t < Tend:
+            # Do not step over the next output point
+            clipped = h >= nextOutputPoint - t
+            hStep = nextOutputPoint - t if clipped else h
+            self.saveState()
+            status = self.doStep(t, hStep)
+            if status == 2:  # Discard
+                lastTime = self.terminatedAt()
+                if lastTime is not None:
+                    # The FMU terminated the simulation
+                    self.handle_result(lastTime)
+                    break
+                if hStep <= self.hMin:
+                    # The step cannot be reduced any further
+                    return False
+                accept = False
+                factor = 0.5
+            else:
+                yNew = self.getOutputs()
+                if yPrevious is None or len(yNew) == 0:
+                    # No error estimate
+                    error = 0.0
+                else:
+                    # Deviation from the extrapolation of the last two communication points
+                    yExtrapolated = y + (hStep / (t - tPrevious)) * (y - yPrevious)
+                    error = numpy.max(numpy.abs(yNew - yExtrapolated) / (self.atol + self.rtol * numpy.abs(yNew)))
+                accept = error <= 1.0
+                if error > 0.0:
+                    # The deviation is of second order in h
+                    factor = min(max(self.safety / numpy.sqrt(error), self.maxReduction), self.maxGrowth)
+                else:
+                    factor = self.maxGrowth
+            if not accept and hStep > self.hMin:
+                # Repeat the step with a smaller step size
+                self.restoreState()
+                self.nRejected += 1
+                h = max(hStep * factor, self.hMin)
+                continue
+            self.nAccepted += 1
+            tPrevious = t
+            yPrevious = y
+            y = numpy.array(yNew)
+            if clipped:
+                t = nextOutputPoint
+                self.handle_result(t)
+                outputStepCounter += 1
+                nextOutputPoint = min(Tstart + outputStepCounter * gridWidth, Tend)
+                # A step shortened at an output point does not reduce the step size
+                h = max(hStep * factor, h) if factor >= 1.0 else hStep * factor
+            else:
+                t = t + hStep
+                h = hStep * factor
+            if self.hMax is not None:
+                h = min(h, self.hMax)
+        return True
+
+
+
+class FixedStepSolver():
     '''
+        Integration methods with fixed step size: explicit Runge-Kutta methods given by
+        their Butcher tableau, with event handling (without rootfinding)
+    '''
+    # Butcher tableaus (a, b, c)
+    tableaus = {'Euler': ([[0.0]], [1.0], [0.0]),
+                'Heun': ([[0.0, 0.0], [1.0, 0.0]], [0.5, 0.5], [0.0, 1.0]),
+                'RK4': ([[0.0, 0.0, 0.0, 0.0], [0.5, 0.0, 0.0, 0.0], [0.0, 0.5, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]],
+                        [1.0 / 6.0, 1.0 / 3.0, 1.0 / 3.0, 1.0 / 6.0], [0.0, 0.5, 0.5, 1.0])}
+
+    def __init__(self, method='Euler', denseOutput=False):
+        ''' method is a key of tableaus. With denseOutput the states between two steps are
+            interpolated by cubic Hermite polynomials (the derivative at the end of a step is
+            the first stage of the next one); otherwise they are interpolated linearly.
+        '''
+        a, b, c = self.tableaus[method]
+        self.a = numpy.array(a)
+        self.b = numpy.array(b)
+        self.c = numpy.array(c)
+        self.method = method
+        self.denseOutput = denseOutput
+        self.completed_step = None
+        self.locateEvents = True  # Locate state events within a step (otherwise they are handled at the end of the step)
+        self.eventTolerance = 1e-10  # Relative tolerance of the time of a located state event
+
+    def _step(self, t, h, firstStageKnown):
+        ''' Computes self.y1 at t+h from self.y0 at t in place.
+            If firstStageKnown, self.f0 is the derivative at (t, self.y0).
+        '''
+        k = self._k
+        if firstStageKnown:
+            k[0, :] = self.f0
+        else:
+            k[0, :] = self.rhs(t, self.y0)
+            self.f0[:] = k[0, :]
+        for i in xrange(1, len(self.b)):
+            numpy.dot(self.a[i, :i], k[:i], out=self._yStage)
+            self._yStage *= h
+            self._yStage += self.y0
+            k[i, :] = self.rhs(t + self.c[i] * h, self._yStage)
+        numpy.dot(self.b, k, out=self.y1)
+        self.y1 *= h
+        self.y1 += self.y0
+        if self.denseOutput:
+            self.f1[:] = self.rhs(t + h, self.y1)
+
+    def _interpolate(self, t0, t1, t):
+        ''' Returns the states at t between the steps at t0 and t1
+        '''
+        theta = (t - t0) / (t1 - t0)
+        if not self.denseOutput:
+            return self.y0 + theta * (self.y1 - self.y0)
+        h = t1 - t0
+        theta2 = theta * theta
+        theta3 = theta2 * theta
+        return ((2.0 * theta3 - 3.0 * theta2 + 1.0) * self.y0 + (theta3 - 2.0 * theta2 + theta) * h * self.f0
+                + (3.0 * theta2 - 2.0 * theta3) * self.y1 + (theta3 - theta2) * h * self.f1)
+
+    def _locateEvent(self, t0, t1, z0, z1):
+        ''' Returns the time just after the first sign change of the event indicators
+            in the step from t0 to t1 and the indicators at this time. z0 and z1 are
+            the indicators at t0 and t1. The time is located by the Illinois method
+            on the indicators of the interpolated states.
+        '''
+        tL, zL = t0, z0.copy()
+        tR, zR = t1, z1.copy()
+        tolerance = self.eventTolerance * max(abs(t1), 1.0)
+        side = 0
+        for i in xrange(100):
+            if tR - tL <= tolerance:
+                break
+            # Secant estimate of the first zero crossing
+            crossing = (zL > 0.0) != (zR > 0.0)
+            fraction = (zL[crossing] / (zL[crossing] - zR[crossing])).min()
+            t = min(max(tL + fraction * (tR - tL), tL + 0.5 * tolerance), tR - 0.5 * tolerance)
+            z = numpy.asarray(self.state_events(t, self._interpolate(t0, t1, t), None))
+            if ((z > 0.0) != (zL > 0.0)).any():
+                tR, zR = t, z
+                if side == -1:
+                    # Illinois modification: the left end was kept twice
+                    zL *= 0.5
+                side = -1
+            else:
+                tL, zL = t, z
+                if side == 1:
+                    zR *= 0.5
+                side = 1
+        return tR, zR
+
     def simulate(self, Tstart, dt, Tend, y0, nOutputIntervals, gridWidth):
         ''' Simulates an ODE-system defined by different functions
-            from Tstart to Tend by the explicit Euler method with the fixed step size dt.
+            from Tstart to Tend with the fixed step size dt.
             The initial start values of the states are given by the vector y0.
-            Time or state events are handled after a successful step if necessary.
-            Result points are defined by the number of output intervals 'nOutputIntervals'
-            that define a time grid between Tstart and Tend with constant width.
-            The grid width can be equal to dt or less or greater than dt.
+            Time or state events are handled after a successful step if necessary;
+            the time of a state event is located within the step if locateEvents is True.
+            Result points are given by gridWidth, or else by the number of output
+            intervals 'nOutputIntervals' that define a time grid between Tstart and Tend
+            with constant width. The grid width can be equal to dt or less or greater than dt.
         '''
-
-        # euler_basic.run_example()
+        n = len(y0)
+        # Preallocated states (y0 -> y1 is the current step), derivatives and stages
+        self.y0 = numpy.array(y0, dtype=float)
+        self.y1 = numpy.empty(n)
+        self.f0 = numpy.empty(n)
+        self.f1 = numpy.empty(n)
+        self._yStage = numpy.empty(n)
+        self._k = numpy.empty((len(self.b), n))
+        firstStageKnown = False
 
         self.t_cur = Tstart
-        self.y_cur = y0.copy()
-        y_cur0 = y0.copy()
-        # Define vectors for crossing and indicator functions
-        z = self.state_events(self.t_cur, self.y_cur, None)
-        zb = numpy.empty(len(z))
-        zb_new = zb.copy()
-        for i in xrange(len(z)):
-            zb[i] = (z[i] > 0.0)
+        self.y_cur = self.y0
+        self.t = self.t_cur
+        self.y = self.y_cur
+        # Event indicators
+        z = numpy.asarray(self.state_events(self.t_cur, self.y_cur, None))
         nextTimeEvent = self.time_events(self.t_cur, self.y_cur, None)
         # Write initial values to results
-        self.handle_result(None, self.t_cur, self.y_cur)
+        self.handle_result(self, self.t_cur, self.y_cur)
         # Define next step point and next output point
         stepCounter = 1
         nextStepPoint = min(Tstart + dt, Tend)
-        if nOutputIntervals > 0:
+        if gridWidth is not None:
+            dOutput = gridWidth
+        elif nOutputIntervals > 0:
             dOutput = (Tend - Tstart) / nOutputIntervals
         else:
             dOutput = dt
@@ -999,68 +1471,80 @@ class ExplicitEulerSolver():
 
         # Start the integration loop
         while self.t_cur < Tend:
-            # Define stepsize h, next step point, t_new and time_event
+            # Define t_new, stepsize h and time_event
             if nextTimeEvent is None or nextStepPoint < nextTimeEvent:
                 time_event = False
-                h = min(dt, Tend - self.t_cur)
-                stepCounter += 1
                 t_new = nextStepPoint
-                nextStepPoint = min(Tstart + stepCounter * dt, Tend)
             else:
                 time_event = True
-                h = nextTimeEvent - self.t_cur
                 t_new = nextTimeEvent
-                if nextStepPoint == nextTimeEvent:
-                    stepCounter += 1
-                    nextStepPoint = min(Tstart + stepCounter * dt, Tend)
-
-            # Do the explicit Euler step
-            temp = self.y_cur
-            self.y_cur = y_cur0
-            self.y_cur[:] = temp[:]
-            y_cur0 = temp
-            t_cur0 = self.t_cur
-            self.y_cur = self.y_cur + h * self.rhs(self.t_cur, self.y_cur)
-            self.t_cur = t_new
-
-            # Check for state events
-            z = self.state_events(self.t_cur, self.y_cur, None)
-            for i in xrange(len(z)):
-                zb_new[i] = (z[i] > 0.0)
-            state_event = (zb_new != zb)
-            temp = zb
-            zb = zb_new
-            zb_new = temp
+            h = t_new - self.t_cur
 
-            # Inform about completed step
-            self.completed_step(self)
-
-            def interpolateLinear(a1, b1, a2, b2, t):
-                return (b2 - b1) / (a2 - a1) * (t - a1) + b1
-
-            # Write output points until the current time
-            while nextOutputPoint < self.t_cur:
-                y_Output = interpolateLinear(t_cur0, y_cur0, self.t_cur, self.y_cur, nextOutputPoint)
-                self.handle_result(None, nextOutputPoint, y_Output)
+            # Do the step
+            t_cur0 = self.t_cur
+            self._step(t_cur0, h, firstStageKnown)
+            firstStageKnown = self.denseOutput
+
+            # Check for state events by sign changes of the event indicators
+            z_new = numpy.asarray(self.state_events(t_new, self.y1, None))
+            state_event = (z_new > 0.0) != (z > 0.0)
+            t_event = t_new
+            if state_event.any() and self.locateEvents:
+                t_event, z_new = self._locateEvent(t_cur0, t_new, z, z_new)
+                state_event = (z_new > 0.0) != (z > 0.0)
+                if t_event < t_new:
+                    # The step ends at the state event
+                    time_event = False
+            z = z_new
+
+            # Write output points until the end of the step
+            while nextOutputPoint < t_event:
+                self.handle_result(self, nextOutputPoint, self._interpolate(t_cur0, t_new, nextOutputPoint))
                 outputStepCounter += 1
                 nextOutputPoint = min(Tstart + outputStepCounter * dOutput, Tend)
 
+            if t_event < t_new:
+                self.y1[:] = self._interpolate(t_cur0, t_new, t_event)
+                firstStageKnown = False
+            self.t_cur = t_event
+            self.y_cur = self.y1
+            self.t = self.t_cur
+            self.y = self.y_cur
+            if self.t_cur >= nextStepPoint:
+                stepCounter += 1
+                nextStepPoint = min(Tstart + stepCounter * dt, Tend)
+
+            # Inform about completed step
+            step_event = self.completed_step is not None and self.completed_step(self)
+
             # Depending on events have been detected do different tasks
-            if state_event.any() or time_event:
+            if state_event.any() or time_event or step_event:
+                # Values before the event
+                self.handle_result(self, self.t_cur, self.y_cur)
+                if nextOutputPoint == self.t_cur:
+                    outputStepCounter += 1
+                    nextOutputPoint = min(Tstart + outputStepCounter * dOutput, Tend)
                 # Event handling
                 event_info = [state_event, time_event]
-                self.t = self.t_cur
-                self.y = self.y_cur
                 if not self.handle_event(self, event_info):
                     break
-                z = self.state_events(self.t_cur, self.y_cur, None)
-                for i in xrange(len(z)):
-                    zb[i] = (z[i] > 0.0)
+                # The event may have changed the states
+                self.y_cur[:] = self.y
+                self.y = self.y_cur
+                firstStageKnown = False
+                # Values after the event
+                self.handle_result(self, self.t_cur, self.y_cur)
+                z = numpy.asarray(self.state_events(self.t_cur, self.y_cur, None))
                 nextTimeEvent = self.time_events(self.t_cur, self.y_cur, None)
             elif nextOutputPoint == self.t_cur:
-                y_Output = interpolateLinear(t_cur0, y_cur0, self.t_cur, self.y_cur, nextOutputPoint)
-                self.handle_result(self, nextOutputPoint, y_Output)
+                self.handle_result(self, nextOutputPoint, self.y_cur)
                 outputStepCounter += 1
                 nextOutputPoint = min(Tstart + outputStepCounter * dOutput, Tend)
 
-        self.finalize(None)
+            # The end of this step is the start of the next one
+            self.y0, self.y1 = self.y1, self.y0
+            self.f0, self.f1 = self.f1, self.f0
+            self.y_cur = self.y0
+            self.y = self.y_cur
+
+        self.finalize(self)
@@ -80,6 +80,11 @@ class IntegrationSettings():
         self.resultFileIncludeParameters = True
         self.resultFileIncludeAuxiliaries = True
         self.resultFileIncludeEvents = True
+        self.resultFileCompression = 'gzip'  # 'none', 'lzf' or 'gzip' (for result files in MTSF format)
+        self.resultFileCompressionLevel = 4  # Level of gzip compression (0 ... 9)
+        self.resultFileChunkColumns = 16  # Number of columns of a chunk of an MTSF dataset
+        self.resultFileChunkBytes = 262144  # Size of a chunk of an MTSF dataset in bytes
+        self.resultFileBackgroundWriter = True  # Write results to an MTSF file in a separate thread
 
 
 class IntegrationStatistics():
@@ -94,6 +99,7 @@ class IntegrationStatistics():
         self.nTimeEvents = None  # Integer
         self.nStateEvents = None  # Integer
         self.nGridPoints = None  # Integer
+        self.nResultFileResizes = None  # Integer
         self.cpuTime = None  # Real
         self.finished = None  # Boolean
 